@@ -4,11 +4,14 @@ Download NSDUH concordance (crosswalk) Excel files from SAMHSA.
 """
 
 from pathlib import Path
-import requests
+import httpx
 
 CONCORDANCE_DIR = Path("metadata/concordance")
 CONCORDANCE_DIR.mkdir(parents=True, exist_ok=True)
 
+# Read buffer for streaming files to disk
+COPY_BUFFER_SIZE = 1 << 16
+
 FILES = {
     "ConcatPUFComparability_2019.xlsx": (
         "https://www.samhsa.gov/data/sites/default/files/variable-crosswalk/"
@@ -28,12 +31,12 @@ def download_file(filename, url):
         return
 
     print(f"⬇ {filename}: ", end="", flush=True)
-    response = requests.get(url, stream=True, timeout=30)
-    response.raise_for_status()
+    with httpx.stream("GET", url, timeout=30, follow_redirects=True) as response:
+        response.raise_for_status()
 
-    with open(output_path, "wb") as f:
-        for chunk in response.iter_content(chunk_size=8192):
-            f.write(chunk)
+        with open(output_path, "wb") as f:
+            for chunk in response.iter_bytes(COPY_BUFFER_SIZE):
+                f.write(chunk)
 
     file_size_mb = output_path.stat().st_size / (1024 * 1024)
     print(f"✓ ({file_size_mb:.1f} MB)")
@@ -4,7 +4,9 @@ Download NSDUH (National Survey on Drug Use and Health) public use files.
 Downloads both Stata data files and setup files (which contain DDI metadata).
 """
 
-import requests
+import re
+import httpx
+from concurrent.futures import ThreadPoolExecutor, as_completed
 from pathlib import Path
 
 # Create data directories
@@ -16,9 +18,43 @@ SETUP_DIR.mkdir(exist_ok=True)
 # Base URL pattern for NSDUH files
 BASE_URL = "https://www.samhsa.gov/data/system/files/media-puf-file/"
 
+# Directory listing used to resolve exact filenames without probing
+MANIFEST_URL = BASE_URL
+
+# Matches bundle filenames in the directory listing, e.g.
+# NSDUH-2019-DS0001-bndl-data-stata_v2.zip
+MANIFEST_RE = re.compile(
+    r'((?:NHSDA|NSDUH)-(\d{4})-DS0001-bndl-data-(stata|ascii-setup-to-stata)(?:_v(\d+))?\.zip)',
+    re.IGNORECASE,
+)
+
 # Years to download (1979-2024)
 YEARS = list(range(1979, 2025))
 
+# Number of concurrent downloads
+MAX_WORKERS = 8
+
+# Read buffer for streaming zips to disk
+COPY_BUFFER_SIZE = 1 << 16
+
+# Total size in a 416 reply's Content-Range header, e.g. "bytes */123456"
+UNSATISFIED_RANGE_RE = re.compile(r'bytes \*/(\d+)')
+
+def make_client():
+    """Create an HTTP/2 client shared by all download threads.
+
+    HTTP/2 multiplexes concurrent probes and downloads over a few
+    connections, so the TLS handshake is paid once rather than per request.
+    """
+    transport = httpx.HTTPTransport(
+        http2=True,
+        retries=3,
+        limits=httpx.Limits(max_keepalive_connections=16, max_connections=32),
+    )
+    return httpx.Client(transport=transport, timeout=30.0, follow_redirects=True)
+
+CLIENT = make_client()
+
 def generate_data_filename_variants(year):
     """Generate possible filename variants for Stata data files."""
     prefix = "NHSDA" if year < 2002 else "NSDUH"
@@ -63,12 +99,134 @@ def generate_setup_filename_variants(year):
     ]
     return variants
 
-def try_download_file(year, file_type='data'):
-    """Try downloading a file by testing multiple filename variants.
+def fetch_manifest(client=CLIENT):
+    """Fetch the SAMHSA file listing once and index it by year.
+
+    Returns:
+        Tuple of dicts ({year: data_filename}, {year: setup_filename}).
+        Both are empty if the listing is unavailable, in which case
+        callers fall back to probing filename variants.
+    """
+    try:
+        response = client.get(MANIFEST_URL)
+        response.raise_for_status()
+    except httpx.HTTPError as e:
+        print(f"⚠️  Could not fetch file listing, probing variants instead - {e}")
+        return {}, {}
+
+    manifest = {'stata': {}, 'ascii-setup-to-stata': {}}
+    versions = {}
+    for filename, year, kind, version in set(MANIFEST_RE.findall(response.text)):
+        year = int(year)
+        kind = kind.lower()
+        version = int(version) if version else 0
+        # Keep the newest release for each year
+        if version >= versions.get((kind, year), -1):
+            versions[(kind, year)] = version
+            manifest[kind][year] = filename
+
+    return manifest['stata'], manifest['ascii-setup-to-stata']
+
+def variant_exists(url, client=CLIENT):
+    """Check whether a URL exists, using HEAD with a GET fallback.
+
+    Some servers reject HEAD (405/501), so fall back to a streamed GET
+    that is closed before the body is read.
+    """
+    try:
+        response = client.head(url, timeout=10)
+        if response.status_code in (405, 501):
+            with client.stream('GET', url, timeout=10) as response:
+                return response.status_code == 200
+        return response.status_code == 200
+    except httpx.HTTPError:
+        return False
+
+def find_available_variant(variants, client=CLIENT):
+    """Probe all filename variants concurrently.
+
+    Returns the first variant (in preference order) that exists, or None.
+    """
+    urls = [BASE_URL + filename for filename in variants]
+    with ThreadPoolExecutor(max_workers=len(urls)) as executor:
+        exists = list(executor.map(lambda url: variant_exists(url, client), urls))
+
+    for filename, found in zip(variants, exists):
+        if found:
+            return filename
+    return None
+
+def remote_size(url, response, client=CLIENT):
+    """Return the full size of url in bytes, or None if the server won't say.
+
+    Taken from the "bytes */N" Content-Range of a 416 response, falling
+    back to the Content-Length of a HEAD request.
+    """
+    match = UNSATISFIED_RANGE_RE.fullmatch(response.headers.get('Content-Range', '').strip())
+    if match:
+        return int(match.group(1))
+    head = client.head(url, headers={'Accept-Encoding': 'identity'})
+    content_length = head.headers.get('Content-Length')
+    if head.status_code == 200 and content_length:
+        return int(content_length)
+    return None
+
+def download_with_resume(url, output_path, client=CLIENT):
+    """Download url to output_path, resuming a previous partial download.
+
+    Data is written to a ".part" file next to the target and renamed once
+    the expected size has been received, so interrupted transfers continue
+    from where they stopped on the next run.
+    """
+    part_path = output_path.with_name(output_path.name + '.part')
+    resume_from = part_path.stat().st_size if part_path.exists() else 0
+    restart = False
+
+    # Byte offsets and Content-Length must refer to the file as stored, so ask
+    # for it unencoded and write the raw body
+    headers = {'Accept-Encoding': 'identity'}
+    if resume_from:
+        headers['Range'] = f'bytes={resume_from}-'
+    with client.stream('GET', url, headers=headers) as response:
+        if response.status_code == 416:
+            # Nothing left to fetch. The partial file is only complete if it is
+            # exactly the remote size; otherwise it is corrupt, so start over.
+            expected_size = remote_size(url, response, client)
+            if expected_size != resume_from:
+                print(f"  ⚠️  Discarding {part_path.name} ({resume_from} bytes, "
+                      f"expected {expected_size})")
+                part_path.unlink()
+                restart = True
+        else:
+            response.raise_for_status()
+            if response.status_code != 206:
+                # Server ignored the range request; start over
+                resume_from = 0
+            content_length = response.headers.get('Content-Length')
+            expected_size = resume_from + int(content_length) if content_length else None
+
+            with open(part_path, 'ab' if resume_from else 'wb') as f:
+                for chunk in response.iter_raw(COPY_BUFFER_SIZE):
+                    f.write(chunk)
+
+    if restart:
+        # The .part file is gone, so this is a plain (non-range) download
+        return download_with_resume(url, output_path, client)
+
+    actual_size = part_path.stat().st_size
+    if expected_size is not None and actual_size != expected_size:
+        raise IOError(f"incomplete download ({actual_size} of {expected_size} bytes)")
+
+    part_path.rename(output_path)
+
+def try_download_file(year, file_type='data', client=CLIENT, manifest=None):
+    """Download a file, resolving its name from the manifest or by probing variants.
 
     Args:
         year: Year to download
         file_type: 'data' for Stata files or 'setup' for setup/DDI files
+        client: httpx.Client used for all HTTP calls
+        manifest: Optional {year: filename} from fetch_manifest()
     """
     if file_type == 'data':
         target_dir = DATA_DIR
@@ -85,59 +243,60 @@ def try_download_file(year, file_type='data'):
         print(f"✓ {year} {file_type}: Already downloaded ({existing_files[0].name})")
         return True
 
-    print(f"⬇ {year} {file_type}: ", end="", flush=True)
-
-    # Try each filename variant
-    for filename in variants:
-        url = BASE_URL + filename
-
-        try:
-            # Use HEAD request first to check if file exists
-            response = requests.head(url, timeout=10, allow_redirects=True)
-
-            if response.status_code == 200:
-                # File exists, now download it
-                response = requests.get(url, stream=True, timeout=30)
-                response.raise_for_status()
-
-                output_path = target_dir / filename
-                with open(output_path, 'wb') as f:
-                    for chunk in response.iter_content(chunk_size=8192):
-                        f.write(chunk)
+    filename = (manifest or {}).get(year)
+    if filename is None:
+        filename = find_available_variant(variants, client)
+    if filename is None:
+        print(f"⬇ {year} {file_type}: ✗ Not found")
+        return False
 
-                file_size_mb = output_path.stat().st_size / (1024 * 1024)
-                print(f"✓ ({file_size_mb:.1f} MB) [{filename}]")
-                return True
+    url = BASE_URL + filename
+    output_path = target_dir / filename
+    try:
+        download_with_resume(url, output_path, client)
 
-        except requests.exceptions.RequestException:
-            # Try next variant
-            continue
+        file_size_mb = output_path.stat().st_size / (1024 * 1024)
+        print(f"⬇ {year} {file_type}: ✓ ({file_size_mb:.1f} MB) [{filename}]")
+        return True
 
-    print(f"✗ Not found")
-    return False
+    except (httpx.HTTPError, IOError) as e:
+        print(f"⬇ {year} {file_type}: ✗ Download failed [{filename}] - {e}")
+        return False
 
 def main():
     print(f"Downloading NSDUH files\n")
     print(f"Data files → {DATA_DIR.absolute()}")
     print(f"Setup files → {SETUP_DIR.absolute()}\n")
 
-    data_success = 0
-    data_failed = 0
-    setup_success = 0
-    setup_failed = 0
+    counts = {
+        'data': {'success': 0, 'failed': 0},
+        # Setup files may not exist for all years
+        'setup': {'success': 0, 'failed': 0},
+    }
 
-    for year in YEARS:
-        # Download data file
-        if try_download_file(year, 'data'):
-            data_success += 1
-        else:
-            data_failed += 1
+    data_manifest, setup_manifest = fetch_manifest()
+    manifests = {'data': data_manifest, 'setup': setup_manifest}
 
-        # Download setup file (these may not exist for all years)
-        if try_download_file(year, 'setup'):
-            setup_success += 1
-        else:
-            setup_failed += 1
+    with ThreadPoolExecutor(max_workers=MAX_WORKERS) as executor:
+        futures = {}
+        for year in YEARS:
+            for file_type in ('data', 'setup'):
+                future = executor.submit(
+                    try_download_file, year, file_type, CLIENT, manifests[file_type]
+                )
+                futures[future] = file_type
+
+        for future in as_completed(futures):
+            file_type = futures[future]
+            if future.result():
+                counts[file_type]['success'] += 1
+            else:
+                counts[file_type]['failed'] += 1
+
+    data_success = counts['data']['success']
+    data_failed = counts['data']['failed']
+    setup_success = counts['setup']['success']
+    setup_failed = counts['setup']['failed']
 
     print(f"\n{'='*60}")
     print(f"Download complete!")
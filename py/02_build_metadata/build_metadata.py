@@ -1,12 +1,13 @@
 #!/usr/bin/env python3
 """
-Build comprehensive variable_metadata.csv combining all metadata sources:
+Build comprehensive variable_metadata.parquet combining all metadata sources:
 1. Stata file variable labels
 2. DDI question text (where available)
 3. Concordance mappings (official SAMHSA harmonization)
 4. Inferred narrow concordance (semantic matching)
 """
 
+import argparse
 import sys
 from pathlib import Path
 import pandas as pd
@@ -22,8 +23,12 @@ from concordance_metadata import load_concordance_files
 sys.path.append(str(Path(__file__).parent / 'helpers'))
 from semantic_matcher import compute_semantic_bridges
 
-def build_variable_metadata():
-    """Build comprehensive variable metadata CSV."""
+def build_variable_metadata(write_csv=False):
+    """Build comprehensive variable metadata (Parquet, optionally CSV).
+
+    Args:
+        write_csv: Also write variable_metadata.csv alongside the Parquet file
+    """
 
     print("="*70)
     print("BUILDING VARIABLE METADATA")
@@ -45,13 +50,14 @@ def build_variable_metadata():
     print("\n[2/5] Extracting DDI question text...")
     ddi_data = extract_all_ddi_metadata(years)
 
-    # Merge DDI into Stata metadata
-    df_stata['question_text'] = ''
-    for year in ddi_data:
-        for idx, row in df_stata[df_stata['year'] == year].iterrows():
-            var_name = row['variable_name']
-            if var_name in ddi_data[year]:
-                df_stata.at[idx, 'question_text'] = ddi_data[year][var_name]
+    # Map DDI question text onto Stata metadata by (year, variable_name)
+    flat_ddi = {
+        (year, var_name): question_text
+        for year, questions in ddi_data.items()
+        for var_name, question_text in questions.items()
+    }
+    keys = pd.MultiIndex.from_arrays([df_stata['year'], df_stata['variable_name']])
+    df_stata['question_text'] = keys.map(flat_ddi).fillna('')
 
     ddi_count = (df_stata['question_text'] != '').sum()
     print(f"✓ Added question text for {ddi_count} variables")
@@ -61,6 +67,13 @@ def build_variable_metadata():
     df_concordance = load_concordance_files()
 
     if not df_concordance.empty:
+        # Names outside the Stata categories could never match the left merge,
+        # and casting them into the categorical dtype is deprecated
+        known_names = df_concordance['variable_name'].isin(df_stata['variable_name'].cat.categories)
+        df_concordance = df_concordance.loc[known_names].astype({
+            'year': df_stata['year'].dtype,
+            'variable_name': df_stata['variable_name'].dtype,
+        })
         # Merge concordance group into main dataframe
         df_stata = df_stata.merge(
             df_concordance[['year', 'variable_name', 'confirmed_group', 'concordance_file']],
@@ -76,10 +89,16 @@ def build_variable_metadata():
     # Add confirmed cross-year key based on official concordance
     has_concordance = df_stata['confirmed_group'].notna() & (df_stata['confirmed_group'] != '')
     df_stata['cross_year_confirmed'] = ''
+    confirmed_rows = df_stata.loc[has_concordance]
     df_stata.loc[has_concordance, 'cross_year_confirmed'] = (
-        df_stata.loc[has_concordance, 'variable_name'].astype(str) + '_' +
-        df_stata.loc[has_concordance, 'concordance_file'].astype(str) + '_' +
-        df_stata.loc[has_concordance, 'confirmed_group'].astype(str)
+        confirmed_rows['variable_name'].astype(str).str.cat(
+            [
+                confirmed_rows['concordance_file'].astype(str),
+                confirmed_rows['confirmed_group'].astype(str),
+            ],
+            sep='_',
+            na_rep='',
+        )
     )
 
     # Step 4: Compute semantic bridges (narrow)
@@ -87,13 +106,23 @@ def build_variable_metadata():
     df_with_bridges = compute_semantic_bridges(df_stata)
 
     # Step 5: Save result
-    print("\n[5/5] Saving variable_metadata.csv...")
-    output_path = Path("metadata/variable_metadata.csv")
+    print("\n[5/5] Saving variable_metadata.parquet...")
+    output_path = Path("metadata/variable_metadata.parquet")
     output_path.parent.mkdir(exist_ok=True)
 
-    df_with_bridges.to_csv(output_path, index=False)
+    # Compact dtypes so repeated strings are dictionary-encoded
+    df_with_bridges['year'] = df_with_bridges['year'].astype('int16')
+    for col in ['variable_name', 'confirmed_group', 'concordance_file']:
+        df_with_bridges[col] = df_with_bridges[col].astype('category')
 
+    df_with_bridges.to_parquet(output_path, compression='zstd', index=False)
     print(f"✓ Saved to {output_path}")
+
+    if write_csv:
+        csv_path = output_path.with_suffix('.csv')
+        df_with_bridges.to_csv(csv_path, index=False)
+        print(f"✓ Saved to {csv_path}")
+
     print(f"\nFinal metadata:")
     print(f"  - Total records: {len(df_with_bridges):,}")
     print(f"  - Years: {df_with_bridges['year'].min()}-{df_with_bridges['year'].max()}")
@@ -107,4 +136,8 @@ def build_variable_metadata():
     print("="*70)
 
 if __name__ == "__main__":
-    build_variable_metadata()
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--csv', action='store_true',
+                        help='also write metadata/variable_metadata.csv')
+    args = parser.parse_args()
+    build_variable_metadata(write_csv=args.csv)
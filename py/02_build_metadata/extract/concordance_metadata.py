@@ -8,6 +8,34 @@ import pandas as pd
 from pathlib import Path
 import re
 
+# Rust-based reader; much faster than the default openpyxl engine
+EXCEL_ENGINE = "calamine"
+
+# Matches PUF year columns like "PUF02" or "PUF 21"
+PUF_COLUMN_RE = re.compile(r"PUF\s*(\d{2})", re.IGNORECASE)
+
+def frame_with_header(raw, header_row):
+    """Use one row of a header-less sheet as column names.
+
+    Mirrors pd.read_excel(header=...): blank headers become "Unnamed: N",
+    repeated names get ".1", ".2", ... suffixes, and column dtypes are
+    re-inferred from the data rows (so group codes stay numeric, e.g. "1.0").
+    """
+    columns = []
+    seen = {}
+    for i, value in enumerate(raw.iloc[header_row]):
+        name = f"Unnamed: {i}" if pd.isna(value) else value
+        if name in seen:
+            seen[name] += 1
+            name = f"{name}.{seen[name]}"
+        else:
+            seen[name] = 0
+        columns.append(name)
+
+    df = raw.iloc[header_row + 1:].reset_index(drop=True).infer_objects()
+    df.columns = columns
+    return df
+
 def load_concordance_files():
     """Load all concordance Excel files and combine them.
 
@@ -39,8 +67,9 @@ def load_concordance_files():
 
     for excel_file in excel_files:
         try:
-            # Read Excel file (detect header row containing VARIABLE)
-            preview = pd.read_excel(excel_file, header=None, nrows=12)
+            # Read the sheet once, then detect the header row containing VARIABLE
+            raw = pd.read_excel(excel_file, header=None, engine=EXCEL_ENGINE)
+            preview = raw.head(12)
             header_row = None
             for idx, row in preview.iterrows():
                 normalized = row.astype(str).str.strip().str.upper()
@@ -56,7 +85,7 @@ def load_concordance_files():
             if header_row is None:
                 header_row = 0
 
-            df = pd.read_excel(excel_file, header=header_row)
+            df = frame_with_header(raw, header_row)
 
             # Concordance files typically have:
             # - One column per year
@@ -89,7 +118,7 @@ def load_concordance_files():
                         continue
 
                     # Match PUF columns like "PUF02" or "PUF 21"
-                    match = re.search(r"PUF\s*(\d{2})", col_str, flags=re.IGNORECASE)
+                    match = PUF_COLUMN_RE.search(col_str)
                     if match:
                         year = 2000 + int(match.group(1))
                         if 1979 <= year <= 2024:
@@ -102,7 +131,7 @@ def load_concordance_files():
                 # Fallback: these files typically use header row 3
                 fallback_header = 3
                 if header_row != fallback_header:
-                    df = pd.read_excel(excel_file, header=fallback_header)
+                    df = frame_with_header(raw, fallback_header)
                     year_cols, year_lookup = find_year_cols(df)
 
             if not year_cols:
@@ -119,10 +148,13 @@ def load_concordance_files():
             )
 
             # Remove rows with no variable name or concordance group
-            df_long = df_long[df_long[variable_col].notna()]
-            df_long = df_long[df_long[variable_col] != '']
-            df_long = df_long[df_long['confirmed_group'].notna()]
-            df_long = df_long[df_long['confirmed_group'] != '']
+            keep = (
+                df_long[variable_col].notna() &
+                (df_long[variable_col] != '') &
+                df_long['confirmed_group'].notna() &
+                (df_long['confirmed_group'] != '')
+            )
+            df_long = df_long.loc[keep].copy()
 
             # Clean up
             df_long['year'] = df_long['year'].map(year_lookup).astype(int)
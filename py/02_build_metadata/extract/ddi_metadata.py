@@ -5,9 +5,21 @@ DDI files contain detailed question text and documentation.
 """
 
 import xml.etree.ElementTree as ET
+from concurrent.futures import ProcessPoolExecutor
 from pathlib import Path
+import json
+import os
 import zipfile
-import tempfile
+
+# Per-year cache of extracted question text, keyed by the source zip's mtime and size
+CACHE_DIR = Path("metadata/_cache")
+# Bump when the extracted question text changes so old cache entries are ignored
+CACHE_VERSION = 1
+
+def cache_path_for(setup_zip, year):
+    """Return the cache file path for a year's setup zip."""
+    stat = setup_zip.stat()
+    return CACHE_DIR / f"ddi_{year}_v{CACHE_VERSION}_{stat.st_mtime_ns}_{stat.st_size}.json"
 
 def extract_ddi_metadata(year):
     """Extract question text from DDI XML files.
@@ -26,60 +38,85 @@ def extract_ddi_metadata(year):
         return {}
 
     setup_zip = setup_files[0]
+
+    cache_path = cache_path_for(setup_zip, year)
+    if cache_path.exists():
+        with open(cache_path, encoding='utf-8') as f:
+            variable_questions = json.load(f)
+        print(f"✓ {year}: Loaded DDI for {len(variable_questions)} variables from cache")
+        return variable_questions
+
     variable_questions = {}
 
     try:
-        with tempfile.TemporaryDirectory() as tmpdir:
-            with zipfile.ZipFile(setup_zip, 'r') as zip_ref:
-                zip_ref.extractall(tmpdir)
-
+        with zipfile.ZipFile(setup_zip, 'r') as zip_ref:
             # Find DDI XML files (usually named *DS0001*.xml or *codebook*.xml)
-            xml_files = list(Path(tmpdir).rglob("*.xml"))
+            xml_files = [name for name in zip_ref.namelist() if name.endswith('.xml')]
 
             # Filter to likely DDI files (containing DS0001 or being the longest filename)
-            ddi_files = [f for f in xml_files if 'DS0001' in f.name.upper()]
+            ddi_files = [name for name in xml_files if 'DS0001' in Path(name).name.upper()]
             if not ddi_files and xml_files:
                 # Use longest filename as heuristic
-                ddi_files = [max(xml_files, key=lambda f: len(f.name))]
+                ddi_files = [max(xml_files, key=lambda name: len(Path(name).name))]
 
             if not ddi_files:
                 return {}
 
             ddi_file = ddi_files[0]
 
-            # Parse DDI XML
-            tree = ET.parse(ddi_file)
-            root = tree.getroot()
-
-            # DDI namespace handling
+            # Stream-parse DDI XML straight from the archive, handling one
+            # var element at a time so the full tree is never held in memory
             ns = {}
-            if root.tag.startswith('{'):
-                ns_url = root.tag.split('}')[0].strip('{')
-                ns = {'ddi': ns_url}
-
-            # Extract variable information
-            # DDI structure: dataDscr/var elements contain variable info
-            for var in root.findall('.//ddi:var', ns) if ns else root.findall('.//var'):
-                var_name = var.get('name', '').upper()
-
-                # Get question text from qstn/qstnLit or labl elements
-                question_text = ''
-
-                # Try qstn/qstnLit first (most detailed)
-                qstn = var.find('.//ddi:qstn/ddi:qstnLit', ns) if ns else var.find('.//qstn/qstnLit')
-                if qstn is not None and qstn.text:
-                    question_text = qstn.text.strip()
-                else:
-                    # Try labl as fallback
-                    labl = var.find('.//ddi:labl', ns) if ns else var.find('.//labl')
-                    if labl is not None and labl.text:
-                        question_text = labl.text.strip()
-
-                if var_name and question_text:
-                    variable_questions[var_name] = question_text
+            var_tag = 'var'
+            parents = []
+            with zip_ref.open(ddi_file) as f:
+                for event, elem in ET.iterparse(f, events=('start', 'end')):
+                    if event == 'start':
+                        if not parents and elem.tag.startswith('{'):
+                            # DDI namespace handling
+                            ns_url = elem.tag.split('}')[0].strip('{')
+                            ns = {'ddi': ns_url}
+                            var_tag = f'{{{ns_url}}}var'
+                        parents.append(elem)
+                        continue
+
+                    parents.pop()
+                    # DDI structure: dataDscr/var elements contain variable info
+                    if elem.tag != var_tag:
+                        continue
+
+                    var_name = elem.get('name', '').upper()
+
+                    # Get question text from qstn/qstnLit or labl elements
+                    question_text = ''
+
+                    # Try qstn/qstnLit first (most detailed)
+                    qstn = elem.find('.//ddi:qstn/ddi:qstnLit', ns) if ns else elem.find('.//qstn/qstnLit')
+                    if qstn is not None and qstn.text:
+                        question_text = qstn.text.strip()
+                    else:
+                        # Try labl as fallback
+                        labl = elem.find('.//ddi:labl', ns) if ns else elem.find('.//labl')
+                        if labl is not None and labl.text:
+                            question_text = labl.text.strip()
+
+                    if var_name and question_text:
+                        variable_questions[var_name] = question_text
+
+                    # Free the processed element
+                    elem.clear()
+                    if parents:
+                        parents[-1].remove(elem)
 
             print(f"✓ {year}: Extracted DDI for {len(variable_questions)} variables")
 
+        # Replace any stale cache entries for this year
+        CACHE_DIR.mkdir(parents=True, exist_ok=True)
+        for stale in CACHE_DIR.glob(f"ddi_{year}_*.json"):
+            stale.unlink()
+        with open(cache_path, 'w', encoding='utf-8') as f:
+            json.dump(variable_questions, f)
+
     except Exception as e:
         print(f"⚠️  {year}: Could not parse DDI - {str(e)}")
 
@@ -94,10 +131,12 @@ def extract_all_ddi_metadata(years):
     Returns:
         Dictionary: {year: {variable_name: question_text}}
     """
-    all_ddi = {}
+    # Years are independent, so fan them out across processes
+    with ProcessPoolExecutor(max_workers=os.cpu_count()) as executor:
+        results = list(executor.map(extract_ddi_metadata, years))
 
-    for year in years:
-        ddi_dict = extract_ddi_metadata(year)
+    all_ddi = {}
+    for year, ddi_dict in zip(years, results):
         if ddi_dict:
             all_ddi[year] = ddi_dict
 
@@ -5,16 +5,52 @@ Returns variable names, labels, and value labels for each year.
 """
 
 import pandas as pd
+import pyreadstat
+from concurrent.futures import ProcessPoolExecutor
+from contextlib import contextmanager
+from functools import partial
 from pathlib import Path
+import json
+import os
 import zipfile
 import tempfile
 import shutil
 
-def extract_stata_metadata(year):
+# Per-year cache of extracted metadata, keyed by the source zip's mtime and size
+CACHE_DIR = Path("metadata/_cache")
+# Bump when the extracted columns change so old cache entries are ignored
+CACHE_VERSION = 4
+
+def cache_path_for(stata_zip, year):
+    """Return the cache file path for a year's Stata zip."""
+    stat = stata_zip.stat()
+    return CACHE_DIR / f"stata_{year}_v{CACHE_VERSION}_{stat.st_mtime_ns}_{stat.st_size}.parquet"
+
+@contextmanager
+def year_scratch_dir(scratch_root, year):
+    """Yield a scratch directory for one year, removing it afterwards.
+
+    Uses scratch_root/<year> when a shared root is given, otherwise a
+    standalone temporary directory.
+    """
+    if scratch_root is None:
+        with tempfile.TemporaryDirectory() as tmpdir:
+            yield tmpdir
+        return
+
+    tmpdir = Path(scratch_root) / str(year)
+    tmpdir.mkdir(parents=True, exist_ok=True)
+    try:
+        yield str(tmpdir)
+    finally:
+        shutil.rmtree(tmpdir, ignore_errors=True)
+
+def extract_stata_metadata(year, scratch_root=None):
     """Extract metadata from a Stata file for a given year.
 
     Args:
         year: Year to extract metadata for
+        scratch_root: Optional shared directory to extract archives into
 
     Returns:
         DataFrame with columns: year, variable_name, variable_label, value_labels
@@ -30,52 +66,68 @@ def extract_stata_metadata(year):
 
     stata_zip = stata_files[0]
 
+    cache_path = cache_path_for(stata_zip, year)
+    if cache_path.exists():
+        df = pd.read_parquet(cache_path)
+        print(f"✓ {year}: Loaded {len(df)} variables from cache")
+        return df
+
     try:
-        # Extract to temporary directory
-        with tempfile.TemporaryDirectory() as tmpdir:
+        # Extract only the .dta member to a scratch directory
+        with year_scratch_dir(scratch_root, year) as tmpdir:
             with zipfile.ZipFile(stata_zip, 'r') as zip_ref:
-                zip_ref.extractall(tmpdir)
-
-            # Find the .dta file (some archives use .DTA)
-            dta_files = list(Path(tmpdir).rglob("*.dta")) + list(Path(tmpdir).rglob("*.DTA"))
-            if not dta_files:
-                print(f"⚠️  {year}: No .dta file in archive")
-                return None
+                # Find the .dta file (some archives use .DTA)
+                dta_names = [name for name in zip_ref.namelist() if name.lower().endswith('.dta')]
+                if not dta_names:
+                    print(f"⚠️  {year}: No .dta file in archive")
+                    return None
 
-            dta_file = dta_files[0]
+                # pyreadstat needs a path on disk rather than a stream
+                dta_file = zip_ref.extract(dta_names[0], tmpdir)
 
             # Read Stata file metadata only (not full data)
             # This is much faster than loading all data
-            with pd.io.stata.StataReader(str(dta_file)) as reader:
-                # Get variable names (pandas StataReader doesn't expose varlist)
-                variable_labels = reader.variable_labels()
-                variable_names = list(variable_labels.keys())
-
-                # Get value labels
-                value_label_dict = reader.value_labels()
-
-                # Build result
-                results = []
-                for var_name in variable_names:
-                    var_label = variable_labels.get(var_name, '')
-
-                    # Get value labels for this variable if they exist
-                    value_labels_str = ''
-                    if var_name in value_label_dict:
-                        val_dict = value_label_dict[var_name]
-                        # Format as "1=Label1; 2=Label2; ..."
-                        value_labels_str = '; '.join([f"{k}={v}" for k, v in val_dict.items()])
-
-                    results.append({
-                        'year': year,
-                        'variable_name': var_name,
-                        'variable_label': var_label,
-                        'value_labels': value_labels_str
-                    })
-
-                df = pd.DataFrame(results)
-                print(f"✓ {year}: Extracted {len(df)} variables")
-                return df
+            _, meta = pyreadstat.read_dta(str(dta_file), metadataonly=True)
+            variable_labels = meta.column_names_to_labels
+            variable_names = meta.column_names
+
+            # Get value labels (keyed by variable name)
+            value_label_dict = meta.variable_value_labels
+
+            # Build result
+            results = []
+            for var_name in variable_names:
+                var_label = variable_labels.get(var_name) or ''
+
+                # Get value labels for this variable if they exist
+                value_labels_str = ''
+                if var_name in value_label_dict:
+                    val_dict = value_label_dict[var_name]
+                    # Format as compact JSON: {"1":"Label1","2":"Label2",...}
+                    value_labels_str = json.dumps(
+                        {str(k): v for k, v in val_dict.items()},
+                        separators=(',', ':'),
+                        ensure_ascii=False,
+                    )
+
+                results.append({
+                    'year': year,
+                    'variable_name': var_name,
+                    'variable_label': var_label,
+                    'value_labels': value_labels_str
+                })
+
+            df = pd.DataFrame(results)
+            df['year'] = df['year'].astype('int16')
+            df['variable_name'] = df['variable_name'].astype('string')
+            print(f"✓ {year}: Extracted {len(df)} variables")
+
+        # Replace any stale cache entries for this year
+        CACHE_DIR.mkdir(parents=True, exist_ok=True)
+        for stale in CACHE_DIR.glob(f"stata_{year}_*"):
+            stale.unlink()
+        df.to_parquet(cache_path, index=False)
+        return df
 
     except Exception as e:
         print(f"✗ {year}: Error - {str(e)}")
@@ -90,15 +142,20 @@ def extract_all_stata_metadata(years):
     Returns:
         DataFrame with all metadata combined
     """
-    all_metadata = []
+    # Years are independent, so fan them out across processes that share
+    # one scratch directory instead of creating one per year
+    with tempfile.TemporaryDirectory() as scratch_root:
+        with ProcessPoolExecutor(max_workers=os.cpu_count()) as executor:
+            extract = partial(extract_stata_metadata, scratch_root=scratch_root)
+            results = list(executor.map(extract, years))
 
-    for year in years:
-        df = extract_stata_metadata(year)
-        if df is not None:
-            all_metadata.append(df)
+    all_metadata = [df for df in results if df is not None]
 
     if all_metadata:
-        return pd.concat(all_metadata, ignore_index=True)
+        df = pd.concat(all_metadata, ignore_index=True)
+        # Dictionary-encode names so merges hash integer codes, not strings
+        df['variable_name'] = df['variable_name'].astype('category')
+        return df
     else:
         return pd.DataFrame()
 
@@ -4,77 +4,115 @@ Compute semantic bridges (narrow) for variable harmonization.
 This is extracted from the original create_two_level_bridge.py logic.
 """
 
+import numpy as np
 import pandas as pd
 import re
 
-def clean_label(label):
-    """Clean variable label for comparison."""
-    if pd.isna(label):
-        return ''
-
-    cleaned = str(label).upper().strip()
+# Semantic feature keywords, checked in order (first label wins). Every
+# keyword is a whole word, so a row matches when one of its word tokens
+# equals a keyword; this lets all labels be found in a single pass.
+SUBSTANCE_KEYWORDS = [
+    ('marijuana', ['MARIJUANA', 'MRJ', 'MJ']),
+    ('cocaine', ['COCAINE', 'COC', 'CRACK', 'CRK']),
+    ('heroin', ['HEROIN', 'HER']),
+    ('hallucinogen', ['HALLUCINOGEN', 'HAL', 'LSD', 'PCP']),
+    ('alcohol', ['ALCOHOL', 'ALC']),
+    ('tobacco', ['TOBACCO', 'CIG', 'SMOKE']),
+    ('stimulant', ['STIMULANT', 'STIM', 'METH']),
+    ('sedative', ['SEDATIVE', 'SED']),
+    ('tranquilizer', ['TRANQUILIZER', 'TRQ']),
+    ('painkiller', ['PAIN', 'ANALGESIC', 'ANL']),
+    ('inhalant', ['INHALANT', 'INH']),
+]
+TIME_KEYWORDS = [
+    ('lifetime', ['LIFETIME', 'EVER']),
+    # "PAST 30", "PAST MONTH", ... are joined into one token first
+    ('past_30_days', ['PAST30', 'PASTMONTH', 'PASTMO']),
+    ('past_year', ['PASTYEAR', 'PAST12', 'PASTYR']),
+]
+MEASURE_KEYWORDS = [
+    ('use_indicator', ['FLAG', 'INDICATOR']),
+    ('age_first_use', ['AGE', 'FIRST']),
+    ('abuse_dependence', ['ABUSE', 'DEPEND']),
+]
+
+WORD_RE = re.compile(r'\w+')
+# Whitespace between PAST and a time unit, e.g. "PAST 30" -> "PAST30"
+PAST_PERIOD_RE = re.compile(r'\bPAST\s*(?=(?:30|MONTH|MO|YEAR|12|YR)\b)')
+
+# Label cleanup patterns
+RC_PREFIX_RE = re.compile(r'^RC-\s*')
+RESPONDENT_PREFIX_RE = re.compile(r'^(?:ADULT|YOUTH):\s*')
+EVER_USED_RE = re.compile(r'\s*-?\s*EVER\s*USED')
+
+def clean_labels(labels):
+    """Clean a Series of variable labels for comparison."""
+    cleaned = labels.fillna('').astype(str).str.upper().str.strip()
     # Remove RC- prefix
-    cleaned = re.sub(r'^RC-\s*', '', cleaned)
+    cleaned = cleaned.str.replace(RC_PREFIX_RE, '', regex=True)
     # Remove common prefixes
-    cleaned = re.sub(r'^(ADULT|YOUTH):\s*', '', cleaned)
-    # Remove "EVER USED" when "LIFETIME" is present
-    if 'LIFETIME' in cleaned or 'EVER' in cleaned:
-        cleaned = re.sub(r'\s*-?\s*EVER\s*USED', '', cleaned)
-    return cleaned.strip()
+    cleaned = cleaned.str.replace(RESPONDENT_PREFIX_RE, '', regex=True)
+    # Remove "EVER USED" (only ever present alongside "EVER")
+    cleaned = cleaned.str.replace(EVER_USED_RE, '', regex=True)
+    return cleaned.str.strip()
+
+def first_match(tokens, index, keywords, default):
+    """Label each row with the highest-priority keyword among its tokens.
 
-def extract_semantic_features(variable_name, variable_label):
-    """Extract semantic features for matching.
+    Args:
+        tokens: Series of word tokens, indexed by the row they came from
+        index: Index of all rows to label
+        keywords: List of (label, [keyword, ...]) in priority order
+        default: Label for rows with no matching keyword
 
-    Returns dict with: substance, time_period, measure_type
+    Returns:
+        Categorical of labels (categories in keyword priority order)
     """
-    text = f"{variable_name} {variable_label}".upper()
-
-    # Substance
-    substance = 'other'
-    substance_patterns = [
-        ('marijuana', r'\b(MARIJUANA|MRJ|MJ)\b'),
-        ('cocaine', r'\b(COCAINE|COC|CRACK|CRK)\b'),
-        ('heroin', r'\b(HEROIN|HER)\b'),
-        ('hallucinogen', r'\b(HALLUCINOGEN|HAL|LSD|PCP)\b'),
-        ('alcohol', r'\b(ALCOHOL|ALC)\b'),
-        ('tobacco', r'\b(TOBACCO|CIG|SMOKE)\b'),
-        ('stimulant', r'\b(STIMULANT|STIM|METH)\b'),
-        ('sedative', r'\b(SEDATIVE|SED)\b'),
-        ('tranquilizer', r'\b(TRANQUILIZER|TRQ)\b'),
-        ('painkiller', r'\b(PAIN|ANALGESIC|ANL)\b'),
-        ('inhalant', r'\b(INHALANT|INH)\b'),
-    ]
-    for sub, pattern in substance_patterns:
-        if re.search(pattern, text):
-            substance = sub
-            break
-
-    # Time period
-    time_period = ''
-    time_patterns = [
-        ('lifetime', r'\b(LIFETIME|EVER)\b'),
-        ('past_30_days', r'\b(PAST\s*(30|MONTH|MO))\b'),
-        ('past_year', r'\b(PAST\s*(YEAR|12|YR))\b'),
-    ]
-    for period, pattern in time_patterns:
-        if re.search(pattern, text):
-            time_period = period
-            break
-
-    # Measure type
-    measure = 'use'
-    if re.search(r'\b(FLAG|INDICATOR)\b', text):
-        measure = 'use_indicator'
-    elif re.search(r'\b(AGE|FIRST)\b', text):
-        measure = 'age_first_use'
-    elif re.search(r'\b(ABUSE|DEPEND)\b', text):
-        measure = 'abuse_dependence'
-
-    return {
-        'substance': substance,
-        'time_period': time_period,
-        'measure_type': measure
-    }
+    rank = {keyword: i for i, (_, words) in enumerate(keywords) for keyword in words}
+    best = tokens.map(rank).dropna().groupby(level=0).min()
+    labels = [label for label, _ in keywords] + [default]
+    codes = best.reindex(index, fill_value=len(keywords)).astype(int).to_numpy()
+    return pd.Categorical.from_codes(codes, categories=labels)
+
+def composite_key(columns):
+    """Dense integer key identifying each distinct combination of values.
+
+    Columns are folded in one at a time: the running key is combined with
+    the next column's codes and factorized again, so it stays below the
+    row count and cannot overflow. Missing values count as a value of
+    their own. Codes are 0..n-1 in order of first appearance.
+
+    Args:
+        columns: List of Series to combine
+    """
+    key = np.zeros(len(columns[0]), dtype=np.int64)
+    for col in columns:
+        codes, uniques = pd.factorize(col, use_na_sentinel=False)
+        key = pd.factorize(key * len(uniques) + codes)[0]
+    return key
+
+def extract_semantic_features(df):
+    """Compute clean label and semantic features for each row.
+
+    Args:
+        df: DataFrame with columns: variable_name, variable_label
+
+    Returns:
+        DataFrame (same index) with columns: clean_label, substance,
+        time_period, measure_type
+    """
+    # Tokenize each row once, then look up every token in the keyword tables
+    text = (
+        df['variable_name'].astype(str) + ' ' + df['variable_label'].fillna('').astype(str)
+    ).str.upper()
+    text = text.str.replace(PAST_PERIOD_RE, 'PAST', regex=True)
+    tokens = text.str.findall(WORD_RE).explode()
+    return pd.DataFrame({
+        'clean_label': clean_labels(df['variable_label']),
+        'substance': first_match(tokens, df.index, SUBSTANCE_KEYWORDS, 'other'),
+        'time_period': first_match(tokens, df.index, TIME_KEYWORDS, ''),
+        'measure_type': first_match(tokens, df.index, MEASURE_KEYWORDS, 'use'),
+    }, index=df.index)
 
 def compute_semantic_bridges(df):
     """Compute narrow cross-year bridges.
@@ -89,26 +127,24 @@ def compute_semantic_bridges(df):
     """
     print("Computing semantic features...")
 
-    # Clean labels
-    df['clean_label'] = df['variable_label'].apply(clean_label)
-
-    # Extract semantic features
-    features = df.apply(
-        lambda row: extract_semantic_features(row['variable_name'], row['variable_label']),
-        axis=1
-    )
-    df['substance'] = features.apply(lambda x: x['substance'])
-    df['time_period'] = features.apply(lambda x: x['time_period'])
-    df['measure_type'] = features.apply(lambda x: x['measure_type'])
+    # Features depend only on (variable_name, variable_label), which repeat
+    # across years: compute them once per distinct pair and broadcast back
+    pair_id = df.groupby(
+        ['variable_name', 'variable_label'], sort=False, dropna=False, observed=True
+    ).ngroup().to_numpy()
+    first_rows = ~pd.Series(pair_id).duplicated().to_numpy()
+    features = extract_semantic_features(df.loc[first_rows])
+    for col in features.columns:
+        df[col] = features[col].array.take(pair_id)
 
     print("Computing narrow bridges...")
     # Narrow bridge: exact match on variable_name AND semantic features
-    df['narrow_key'] = (
-        df['variable_name'] + '|' +
-        df['clean_label'] + '|' +
-        df['time_period'].fillna('') + '|' +
-        df['substance']
-    )
+    df['narrow_key'] = composite_key([
+        df['variable_name'],
+        df['clean_label'],
+        df['time_period'].fillna(''),
+        df['substance'],
+    ])
 
     def expand_keys_with_confirmed(key_col):
         if 'cross_year_confirmed' not in df.columns:
@@ -116,27 +152,31 @@ def compute_semantic_bridges(df):
         has_confirmed = df['cross_year_confirmed'].notna() & (df['cross_year_confirmed'] != '')
         if not has_confirmed.any():
             return
-        key_to_confirmed = {}
-        for confirmed_id, keys in (
-            df.loc[has_confirmed].groupby('cross_year_confirmed')[key_col].unique().items()
-        ):
-            for key in keys:
-                if key not in key_to_confirmed:
-                    key_to_confirmed[key] = confirmed_id
-        df[key_col] = df[key_col].map(lambda k: key_to_confirmed.get(k, k))
+        # Each key goes to the lowest confirmed id it appears with. Keys are
+        # dense codes 0..n-1, so confirmed groups get codes n, n+1, ...
+        pairs = (
+            df.loc[has_confirmed, [key_col, 'cross_year_confirmed']]
+            .sort_values('cross_year_confirmed', kind='stable')
+            .drop_duplicates(subset=[key_col], keep='first')
+        )
+        confirmed_codes, _ = pd.factorize(pairs['cross_year_confirmed'])
+        lookup = np.arange(df[key_col].max() + 1)
+        lookup[pairs[key_col].to_numpy()] = len(lookup) + confirmed_codes
+        df[key_col] = lookup[df[key_col].to_numpy()]
 
     # Expand narrow groups to include anything matching a confirmed group
     expand_keys_with_confirmed('narrow_key')
 
     # Group by narrow key and use first year + representative name for stable IDs
-    narrow_group_info = (
+    representative = (
         df[['narrow_key', 'year', 'variable_name']]
         .sort_values(['year', 'variable_name'])
         .groupby('narrow_key', sort=False)
-        .first()
+        .transform('first')
     )
-    df['cross_year_narrow'] = df['narrow_key'].map(
-        lambda k: f"{narrow_group_info.at[k, 'variable_name']}_narrow_{int(narrow_group_info.at[k, 'year'])}"
+    df['cross_year_narrow'] = (
+        representative['variable_name'].astype(str) + '_narrow_' +
+        representative['year'].astype(int).astype(str)
     )
 
     # Clean up temporary columns
@@ -3,21 +3,130 @@
 Build SQLite database from NSDUH Stata files with normalized age variables
 and comprehensive variable metadata
 """
+import argparse
+import contextlib
+import io
 import pandas as pd
 import sys
 import pyreadstat
 import zipfile
 import sqlite3
-import glob
+import hashlib
+import json
 import os
+import re
+import shutil
+import tempfile
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
 from pathlib import Path
 import numpy as np
+import pyarrow as pa
+import pyarrow.parquet as pq
 from datetime import datetime
 
 # Allow importing concordance loader from metadata pipeline
 sys.path.append(str(Path(__file__).parent.parent / '02_build_metadata' / 'extract'))
 from concordance_metadata import load_concordance_files
 
+# Drug flags to keep from each year's file
+DRUG_FLAGS = [
+    'ALCFLAG', 'COCFLAG', 'HERFLAG', 'MJOFLAG', 'MRJFLAG', 'CIGFLAG',
+    'HALFLAG', 'PSYFLAG2', 'SUMFLAG', 'INHFLAG', 'PCPFLAG', 'SMKFLAG',
+    'LSDFLAG', 'SEDFLAG', 'STMFLAG', 'TRQFLAG', 'CGRFLAG', 'CRKFLAG',
+    'ECSFLAG', 'CDUFLAG', 'PIPFLAG', 'TOBFLAG', 'IEMFLAG', 'MTHFLAG',
+    'ANLFLAG', 'SNFFLAG', 'CHWFLAG', 'OXYFLAG', 'DAMTFXFLAG', 'KETMINFLAG'
+]
+
+# Derived flags and their source variables, in order of preference
+DERIVED_FLAGS = {
+    'ecstasy': ['ECSTMOFLAG', 'ECSFLAG', 'ECSTASY'],
+    'any_illicit': ['ILLFLAG', 'SUMFLAG'],
+    'hallucinogen': ['HALLUCFLAG', 'HALFLAG'],
+    'methamphetamine': ['METHAMFLAG', 'MTHFLAG'],
+    'illicit_except_marijuana': ['ILLEMFLAG', 'IEMFLAG'],
+    'stimulants': ['STMANYFLAG', 'STMFLAG'],
+    'marijuana': ['MRJFLAG', 'MJOFLAG'],
+    'psychotherapeutics': ['PSYANYFLAG2', 'PSYFLAG2'],
+    'inhalants': ['INHALFLAG', 'INHFLAG'],
+    'tranquilizers': ['TRQANYFLAG', 'TRQFLAG'],
+    'sedatives': ['SEDANYFLAG', 'SEDFLAG'],
+    'pain_relievers': ['PNRANYFLAG', 'ANLFLAG'],
+    'ketamine': ['KETAFLGR', 'KETMINFLAG'],
+}
+
+# CATAGE codes to age group labels
+CATAGE_MAP = {
+    1: '12-17',
+    2: '18-25',
+    3: '26-34',
+    4: '35+'
+}
+
+# Age and weight candidates (see get_age_var / get_weight_var)
+AGE_VARS = ['CATAGE']
+WEIGHT_VARS = ['ANALWT_C', 'ANALWT2_C', 'ANALWT', 'ANALWT2']
+
+# Rough in-memory size of a decoded year relative to its zip (DTA copy + frame)
+DTA_EXPANSION = 12
+
+# Stata bundle names look like NSDUH-2015-DS0001-bndl-data-stata.zip
+STATA_ZIP_RE = re.compile(r'^[^-]+-(\d{4})-.*stata.*\.zip$')
+
+# Per-year cache of processed survey data, keyed by a hash of the source zip
+CACHE_DIR = Path('data/cache')
+# Bump when process_year's output changes so old cache entries are ignored
+CACHE_VERSION = 2
+HASH_CHUNK_SIZE = 1 << 20
+
+# Rows per executemany batch when loading survey_data
+INSERT_CHUNK_ROWS = 50_000
+
+# Bulk-load settings: the database is rebuilt from scratch, so no journal
+BULK_LOAD_PRAGMAS = """
+PRAGMA journal_mode=OFF;
+PRAGMA synchronous=OFF;
+PRAGMA temp_store=MEMORY;
+PRAGMA cache_size=-262144;
+"""
+
+# Every source column process_year can use; all others are skipped on read
+WANTED_COLUMNS = set(
+    AGE_VARS + WEIGHT_VARS + DRUG_FLAGS
+    + [source for sources in DERIVED_FLAGS.values() for source in sources]
+)
+
+def downcast_flag(series):
+    """Cast a 0/1/NA indicator to nullable Int8.
+
+    Columns with fractional or out-of-range values (raw items carrying
+    missing-data codes) become float64. A flag is therefore only ever Int8
+    or float64, and combine_parquet_pieces keeps it Int8 only when it fits
+    in every year, so each column ends up with one type across years.
+    """
+    values = series.dropna()
+    if len(values) and ((values % 1 != 0).any() or values.min() < -128 or values.max() > 127):
+        return series.astype('float64')
+    return series.astype('Int8')
+
+def find_stata_zips(data_dir):
+    """Return (zip path, year) for every Stata bundle in data_dir, by year"""
+    if not os.path.isdir(data_dir):
+        return []
+    with os.scandir(data_dir) as entries:
+        found = [(entry.path, int(match.group(1)))
+                 for entry in entries
+                 if (match := STATA_ZIP_RE.match(entry.name))]
+    return sorted(found, key=lambda item: item[1])
+
+def cache_path_for(zip_path, year):
+    """Return the cache file path for a year's Stata zip (content-hashed)"""
+    digest = hashlib.sha1()
+    with open(zip_path, 'rb') as f:
+        for block in iter(lambda: f.read(HASH_CHUNK_SIZE), b''):
+            digest.update(block)
+    return CACHE_DIR / f"nsduh_{year}_v{CACHE_VERSION}_{digest.hexdigest()[:12]}.parquet"
+
 def find_dta_in_zip(zip_path):
     """Find the .dta file in a zip archive"""
     with zipfile.ZipFile(zip_path, 'r') as z:
@@ -31,6 +140,57 @@ def find_dta_in_zip(zip_path):
             return sorted(dta_files, key=len, reverse=True)[0]
     return None
 
+def scratch_dir_for(size_bytes):
+    """Pick a directory to extract a file of the given size into.
+
+    Prefers the RAM-backed /dev/shm so the DTA never touches disk, falling
+    back to the default temp location when it is missing or too small.
+    """
+    shm = Path('/dev/shm')
+    if shm.is_dir() and shutil.disk_usage(shm).free > size_bytes * 1.1:
+        return str(shm)
+    return None
+
+@contextlib.contextmanager
+def extracted_member(z, member):
+    """Extract a zip member into a scratch directory, yielding its path.
+
+    Other workers extract at the same time, so RAM-backed scratch space can
+    fill up between the free-space check and the copy; on an OSError
+    (ENOSPC) the member is extracted to disk instead.
+    """
+    size = z.getinfo(member).file_size
+    scratch = scratch_dir_for(size)
+    for directory in ([scratch, None] if scratch else [None]):
+        tmpdir = tempfile.TemporaryDirectory(dir=directory)
+        path = os.path.join(tmpdir.name, os.path.basename(member))
+        try:
+            with z.open(member) as src, open(path, 'wb') as dst:
+                shutil.copyfileobj(src, dst, length=4 * 1024 * 1024)
+        except OSError:
+            tmpdir.cleanup()
+            if directory is None:
+                raise
+            continue
+        with tmpdir:
+            yield path
+        return
+
+def read_dta_from_zip(zip_path, dta_file, wanted=None):
+    """Read a DTA member of a zip archive with pyreadstat.
+
+    pyreadstat needs a real file path, so the member is streamed into a
+    scratch directory (RAM-backed when possible) and removed afterwards.
+    If wanted is given (a set of uppercase names), only those columns are
+    decoded; the column list comes from a cheap metadata-only read.
+    """
+    with zipfile.ZipFile(zip_path, 'r') as z, extracted_member(z, dta_file) as dta_path:
+        usecols = None
+        if wanted is not None:
+            _, meta = pyreadstat.read_dta(dta_path, metadataonly=True)
+            usecols = [col for col in meta.column_names if col.upper() in wanted]
+        return pyreadstat.read_dta(dta_path, usecols=usecols)
+
 def get_age_var(available_cols):
     """Get the age variable name from available columns"""
     # CATAGE is consistent across all years (1=12-17, 2=18-25, 3=26-34, 4=35+)
@@ -40,13 +200,7 @@ def get_age_var(available_cols):
 
 def decode_catage(catage_value):
     """Convert CATAGE coded value to age group label"""
-    mapping = {
-        1: '12-17',
-        2: '18-25',
-        3: '26-34',
-        4: '35+'
-    }
-    return mapping.get(catage_value, None)
+    return CATAGE_MAP.get(catage_value, None)
 
 def get_weight_var(available_cols, year):
     """Get the analysis weight variable for a given year"""
@@ -66,176 +220,347 @@ def get_weight_var(available_cols, year):
 
     return None
 
-def process_year(zip_path, year):
-    """Process a single year of data and return DataFrame"""
-    print(f"\n{'='*60}")
-    print(f"Processing {year}...")
-    print(f"{'='*60}")
+def process_year(zip_path, year, verbose=True):
+    """Process a single year of data and return DataFrame.
+
+    Args:
+        zip_path: Path to the year's Stata zip
+        year: Survey year
+        verbose: Print per-year details; errors and warnings are always printed
+    """
+    def log(message=''):
+        if verbose:
+            print(message)
+
+    log(f"\n{'='*60}")
+    log(f"Processing {year}...")
+    log(f"{'='*60}")
+
+    cache_path = cache_path_for(zip_path, year)
+    if cache_path.exists():
+        df_subset = pd.read_parquet(cache_path)
+        log(f"  ✓ Loaded {len(df_subset):,} records with {len(df_subset.columns)} columns from cache")
+        return df_subset
 
     # Find DTA file in zip
     dta_file = find_dta_in_zip(zip_path)
     if not dta_file:
-        print(f"  ❌ No DTA file found")
+        print(f"  ❌ {year}: No DTA file found")
         return None
 
-    print(f"  Found DTA file: {dta_file}")
+    log(f"  Found DTA file: {dta_file}")
 
-    # Extract and read the DTA file
-    import tempfile
-    with tempfile.TemporaryDirectory() as tmpdir:
-        with zipfile.ZipFile(zip_path, 'r') as z:
-            z.extract(dta_file, tmpdir)
-            dta_path = os.path.join(tmpdir, dta_file)
-            df, meta = pyreadstat.read_dta(dta_path)
+    # Read the DTA file
+    df, meta = read_dta_from_zip(zip_path, dta_file, wanted=WANTED_COLUMNS)
 
-        # Normalize all column names to uppercase
-        df.columns = df.columns.str.upper()
+    # Normalize all column names to uppercase
+    df.columns = df.columns.str.upper()
+    # Source columns, for membership checks below
+    col_set = set(df.columns)
 
-        print(f"  Total records: {len(df):,}")
+    log(f"  Total records: {len(df):,}")
 
-        # Get age variable
-        age_var = get_age_var(df.columns)
-        if age_var is None:
-            print(f"  ❌ No age variable found in columns")
-            return None
+    # Get age variable
+    age_var = get_age_var(col_set)
+    if age_var is None:
+        print(f"  ❌ {year}: No age variable found in columns")
+        return None
 
-        print(f"  Age variable: {age_var}")
+    log(f"  Age variable: {age_var}")
 
-        # Check age statistics
-        age_data = df[age_var].dropna()
-        if len(age_data) == 0:
-            print(f"  ❌ No valid age data")
-            return None
+    # Check age statistics
+    age_data = df[age_var].dropna()
+    if len(age_data) == 0:
+        print(f"  ❌ {year}: No valid age data")
+        return None
 
-        # Since CATAGE is categorical (1-4), show distribution
+    # Since CATAGE is categorical (1-4), count once for the log and the checks
+    value_counts = age_data.value_counts().sort_index()
+    total = len(age_data)
+    if verbose:
         print(f"\n  Age Category Distribution (CATAGE):")
-        value_counts = age_data.value_counts().sort_index()
-        total = len(age_data)
-
-        for cat_value, count in value_counts.items():
-            label = decode_catage(cat_value)
-            pct = (count / total) * 100
-            print(f"    {int(cat_value)}: {label:8} - {count:,} ({pct:.1f}%)")
-
+        print('\n'.join(
+            f"    {int(cat_value)}: {decode_catage(cat_value):8} - {count:,} ({count / total * 100:.1f}%)"
+            for cat_value, count in value_counts.items()
+        ))
         print(f"\n  Total valid: {total:,}")
         print(f"  Missing:     {len(df) - total:,}")
 
-        # Sanity checks
-        warnings = []
-        unique_vals = sorted(age_data.unique())
-        if min(unique_vals) < 1 or max(unique_vals) > 4:
-            warnings.append(f"⚠️  CATAGE values outside expected range (1-4): {unique_vals}")
-        if len(unique_vals) < 4:
-            warnings.append(f"⚠️  Missing some age categories. Found: {unique_vals}")
-
-        if warnings:
-            print(f"\n  WARNINGS:")
-            for w in warnings:
-                print(f"    {w}")
-        else:
-            print(f"\n  ✓ Age categories look good")
+    # Sanity checks
+    warnings = []
+    unique_vals = list(value_counts.index)
+    if min(unique_vals) < 1 or max(unique_vals) > 4:
+        warnings.append(f"⚠️  CATAGE values outside expected range (1-4): {unique_vals}")
+    if len(unique_vals) < 4:
+        warnings.append(f"⚠️  Missing some age categories. Found: {unique_vals}")
+
+    if warnings:
+        print(f"\n  WARNINGS ({year}):")
+        for w in warnings:
+            print(f"    {w}")
+    else:
+        log(f"\n  ✓ Age categories look good")
+
+    # Create normalized age category column
+    df['age_category'] = df[age_var]
+    df['age_group'] = df[age_var].map(CATAGE_MAP)
+
+    # Get weight variable
+    weight_var = get_weight_var(col_set, year)
+    if weight_var:
+        log(f"  Weight variable: {weight_var}")
+        df['analysis_weight'] = df[weight_var]
+    else:
+        print(f"  ⚠️  {year}: No weight variable found - creating unit weights")
+        df['analysis_weight'] = 1.0
+
+    # Count drug flags present (all columns now uppercase)
 
-        # Create normalized age category column
-        df['age_category'] = df[age_var]
-        df['age_group'] = df[age_var].apply(decode_catage)
+    present_flags = [f for f in DRUG_FLAGS if f in col_set]
+    log(f"\n  Drug flags present: {len(present_flags)}/{len(DRUG_FLAGS)}")
 
-        # Get weight variable
-        weight_var = get_weight_var(df.columns, year)
-        if weight_var:
-            print(f"  Weight variable: {weight_var}")
-            df['analysis_weight'] = df[weight_var]
+    if len(present_flags) > 0:
+        log(f"  Sample flags: {', '.join(present_flags[:5])}")
+        if len(present_flags) > 5:
+            log(f"               ... and {len(present_flags) - 5} more")
+
+    # Derived flags with series breaks when question/variable name changes
+    def add_derived_flag(target, sources):
+        source = next((col for col in sources if col in col_set), None)
+        if source:
+            df[target] = df[source]
+            df[f"{target}_source"] = source
         else:
-            print(f"  ⚠️  No weight variable found - creating unit weights")
-            df['analysis_weight'] = 1.0
-
-        # Count drug flags present (all columns now uppercase)
-        drug_flags = [
-            'ALCFLAG', 'COCFLAG', 'HERFLAG', 'MJOFLAG', 'MRJFLAG', 'CIGFLAG',
-            'HALFLAG', 'PSYFLAG2', 'SUMFLAG', 'INHFLAG', 'PCPFLAG', 'SMKFLAG',
-            'LSDFLAG', 'SEDFLAG', 'STMFLAG', 'TRQFLAG', 'CGRFLAG', 'CRKFLAG',
-            'ECSFLAG', 'CDUFLAG', 'PIPFLAG', 'TOBFLAG', 'IEMFLAG', 'MTHFLAG',
-            'ANLFLAG', 'SNFFLAG', 'CHWFLAG', 'OXYFLAG', 'DAMTFXFLAG', 'KETMINFLAG'
-        ]
-
-        present_flags = [f for f in drug_flags if f in df.columns]
-        print(f"\n  Drug flags present: {len(present_flags)}/{len(drug_flags)}")
-
-        if len(present_flags) > 0:
-            print(f"  Sample flags: {', '.join(present_flags[:5])}")
-            if len(present_flags) > 5:
-                print(f"               ... and {len(present_flags) - 5} more")
-
-        # Derived flags with series breaks when question/variable name changes
-        def add_derived_flag(target, sources):
-            source = next((col for col in sources if col in df.columns), None)
-            if source:
-                df[target] = df[source]
-                df[f"{target}_source"] = source
-            else:
-                df[target] = pd.NA
-                df[f"{target}_source"] = pd.NA
-
-        add_derived_flag('ecstasy', ['ECSTMOFLAG', 'ECSFLAG', 'ECSTASY'])
-        add_derived_flag('any_illicit', ['ILLFLAG', 'SUMFLAG'])
-        add_derived_flag('hallucinogen', ['HALLUCFLAG', 'HALFLAG'])
-        add_derived_flag('methamphetamine', ['METHAMFLAG', 'MTHFLAG'])
-        add_derived_flag('illicit_except_marijuana', ['ILLEMFLAG', 'IEMFLAG'])
-        add_derived_flag('stimulants', ['STMANYFLAG', 'STMFLAG'])
-        add_derived_flag('marijuana', ['MRJFLAG', 'MJOFLAG'])
-        add_derived_flag('psychotherapeutics', ['PSYANYFLAG2', 'PSYFLAG2'])
-        add_derived_flag('inhalants', ['INHALFLAG', 'INHFLAG'])
-        add_derived_flag('tranquilizers', ['TRQANYFLAG', 'TRQFLAG'])
-        add_derived_flag('sedatives', ['SEDANYFLAG', 'SEDFLAG'])
-        add_derived_flag('pain_relievers', ['PNRANYFLAG', 'ANLFLAG'])
-        add_derived_flag('ketamine', ['KETAFLGR', 'KETMINFLAG'])
-
-        # Add year column and respondent_id (use index as unique ID within year)
-        df['year'] = year
-        df['respondent_id'] = df.index
-
-        # Select columns to keep: year, respondent_id, age_category, age_group, analysis_weight, and all drug flags
-        cols_to_keep = [
-            'year',
-            'respondent_id',
-            'age_category',
-            'age_group',
-            'analysis_weight',
-            'ecstasy',
-            'ecstasy_source',
-            'any_illicit',
-            'any_illicit_source',
-            'hallucinogen',
-            'hallucinogen_source',
-            'methamphetamine',
-            'methamphetamine_source',
-            'illicit_except_marijuana',
-            'illicit_except_marijuana_source',
-            'stimulants',
-            'stimulants_source',
-            'marijuana',
-            'marijuana_source',
-            'psychotherapeutics',
-            'psychotherapeutics_source',
-            'inhalants',
-            'inhalants_source',
-            'tranquilizers',
-            'tranquilizers_source',
-            'sedatives',
-            'sedatives_source',
-            'pain_relievers',
-            'pain_relievers_source',
-            'ketamine',
-            'ketamine_source',
-        ] + present_flags
-        df_subset = df[cols_to_keep].copy()
-
-        print(f"\n  ✓ Processed {len(df_subset):,} records with {len(cols_to_keep)} columns")
+            df[target] = pd.NA
+            df[f"{target}_source"] = pd.NA
+
+    for target, sources in DERIVED_FLAGS.items():
+        add_derived_flag(target, sources)
+
+    # Add year column and respondent_id (use index as unique ID within year)
+    df['year'] = year
+    df['respondent_id'] = df.index
+
+    # Select columns to keep: year, respondent_id, age_category, age_group, analysis_weight, and all drug flags
+    cols_to_keep = [
+        'year',
+        'respondent_id',
+        'age_category',
+        'age_group',
+        'analysis_weight',
+        'ecstasy',
+        'ecstasy_source',
+        'any_illicit',
+        'any_illicit_source',
+        'hallucinogen',
+        'hallucinogen_source',
+        'methamphetamine',
+        'methamphetamine_source',
+        'illicit_except_marijuana',
+        'illicit_except_marijuana_source',
+        'stimulants',
+        'stimulants_source',
+        'marijuana',
+        'marijuana_source',
+        'psychotherapeutics',
+        'psychotherapeutics_source',
+        'inhalants',
+        'inhalants_source',
+        'tranquilizers',
+        'tranquilizers_source',
+        'sedatives',
+        'sedatives_source',
+        'pain_relievers',
+        'pain_relievers_source',
+        'ketamine',
+        'ketamine_source',
+    ] + present_flags
+    df_subset = df[cols_to_keep].copy()
+
+    # Shrink the numbers before concat: flags and age to Int8, weights to float32
+    for col in list(DERIVED_FLAGS) + present_flags:
+        df_subset[col] = downcast_flag(df_subset[col])
+    df_subset['age_category'] = df_subset['age_category'].astype('Int8')
+    df_subset['analysis_weight'] = df_subset['analysis_weight'].astype('float32')
+
+    log(f"\n  ✓ Processed {len(df_subset):,} records with {len(cols_to_keep)} columns")
+
+    # Replace any stale cache entries for this year
+    CACHE_DIR.mkdir(parents=True, exist_ok=True)
+    for stale in CACHE_DIR.glob(f"nsduh_{year}_*.parquet"):
+        stale.unlink()
+    df_subset.to_parquet(cache_path, compression='zstd', index=False)
+
+    return df_subset
+
+def process_year_logged(zip_path, year, verbose=False):
+    """Run process_year in a worker, capturing its console output.
+
+    Returns:
+        (year, DataFrame or None, log text) so the main process can print
+        each year's log in one piece.
+    """
+    buffer = io.StringIO()
+    with contextlib.redirect_stdout(buffer):
+        df = process_year(zip_path, year, verbose=verbose)
+    return year, df, buffer.getvalue()
+
+def available_memory():
+    """Bytes of RAM available for new work, or None if unknown.
+
+    Uses MemAvailable from /proc/meminfo, which counts reclaimable page
+    cache (MemFree does not, and is tiny right after reading the zips),
+    falling back to total physical memory.
+    """
+    try:
+        with open('/proc/meminfo') as f:
+            for line in f:
+                if line.startswith('MemAvailable:'):
+                    return int(line.split()[1]) * 1024
+    except OSError:
+        pass
+    try:
+        return os.sysconf('SC_PAGE_SIZE') * os.sysconf('SC_PHYS_PAGES')
+    except (AttributeError, ValueError, OSError):
+        return None
 
-        return df_subset
+def worker_count(zip_files):
+    """Number of years to decode at once, bounded by cores and available RAM"""
+    workers = max(1, (os.cpu_count() or 2) // 2)
+    free_ram = available_memory()
+    if free_ram:
+        largest = max(os.path.getsize(zip_path) for zip_path in zip_files)
+        workers = min(workers, max(1, free_ram // (largest * DTA_EXPANSION)))
+    return min(workers, len(zip_files))
+
+def map_in_order(executor, fn, *iterables, window):
+    """Like executor.map, but with at most `window` unconsumed tasks.
+
+    executor.map submits every task up front, so finished results pile up
+    in this process while the caller is still busy with earlier ones. Here
+    the next task is only submitted once the oldest result has been taken.
+    Results are yielded in submission order.
+    """
+    pending = deque()
+    for args in zip(*iterables):
+        if len(pending) >= window:
+            yield pending.popleft().result()
+        pending.append(executor.submit(fn, *args))
+    while pending:
+        yield pending.popleft().result()
+
+def sqlite_type(dtype):
+    """SQLite column type for a pandas dtype"""
+    if pd.api.types.is_bool_dtype(dtype) or pd.api.types.is_integer_dtype(dtype):
+        return 'INTEGER'
+    if pd.api.types.is_float_dtype(dtype):
+        return 'REAL'
+    return 'TEXT'
+
+def create_table(conn, table, df):
+    """(Re)create a table with columns typed from a DataFrame"""
+    columns = ', '.join(f'"{col}" {sqlite_type(dtype)}' for col, dtype in df.dtypes.items())
+    conn.execute(f'DROP TABLE IF EXISTS "{table}"')
+    conn.execute(f'CREATE TABLE "{table}" ({columns})')
+
+def add_missing_columns(conn, table, df, table_columns):
+    """Append columns the table does not have yet (years differ in flags).
+
+    Args:
+        table_columns: Current column names of the table; updated in place
+    """
+    for col, dtype in df.dtypes.items():
+        if col not in table_columns:
+            conn.execute(f'ALTER TABLE "{table}" ADD COLUMN "{col}" {sqlite_type(dtype)}')
+            table_columns.append(col)
+
+def insert_rows(conn, table, df, chunk_rows=INSERT_CHUNK_ROWS):
+    """Bulk insert a DataFrame with executemany in one transaction.
+
+    Values are converted to Python scalars column by column (None for
+    missing), since sqlite3 cannot bind numpy scalars or pd.NA.
+    """
+    names = ', '.join(f'"{col}"' for col in df.columns)
+    placeholders = ', '.join('?' * len(df.columns))
+    sql = f'INSERT INTO "{table}" ({names}) VALUES ({placeholders})'
+    with conn:
+        for start in range(0, len(df), chunk_rows):
+            chunk = df.iloc[start:start + chunk_rows]
+            columns = [chunk[col].astype(object).where(chunk[col].notna(), None).tolist()
+                       for col in chunk.columns]
+            conn.executemany(sql, zip(*columns))
+
+def combine_parquet_pieces(piece_paths, output_path):
+    """Concatenate per-year Parquet files into one, one piece in memory at a time.
+
+    Columns are the union across pieces in order of first appearance (as
+    pd.concat would give); a column missing from a piece is written as nulls.
+    A column typed differently across pieces is promoted to a common type
+    (e.g. an Int8 flag and a float64 one with missing-data codes give float64;
+    an all-missing, null-typed column takes the other years' type).
+    """
+    piece_schemas = [pq.read_schema(piece) for piece in piece_paths]
+    unified = pa.unify_schemas(piece_schemas, promote_options='permissive')
+
+    # pandas dtype metadata from a piece that already has the final type
+    pandas_columns = {}
+    for piece_schema in piece_schemas:
+        for col in piece_schema.pandas_metadata['columns']:
+            name = col['field_name']
+            if name in unified.names and piece_schema.field(name).type == unified.field(name).type:
+                pandas_columns.setdefault(name, col)
+    for field in unified:
+        if field.name not in pandas_columns:
+            dtype = np.dtype(field.type.to_pandas_dtype()).name
+            pandas_columns[field.name] = {'name': field.name, 'field_name': field.name,
+                                          'pandas_type': dtype, 'numpy_type': dtype,
+                                          'metadata': None}
+
+    pandas_metadata = dict(piece_schemas[0].pandas_metadata,
+                           columns=[pandas_columns[name] for name in unified.names])
+    schema = unified.with_metadata({b'pandas': json.dumps(pandas_metadata).encode()})
+
+    with pq.ParquetWriter(output_path, schema, compression='zstd') as writer:
+        for piece in piece_paths:
+            table = pq.read_table(piece)
+            arrays = [
+                table.column(name).cast(field.type) if name in table.column_names
+                else pa.nulls(len(table), field.type)
+                for name, field in zip(schema.names, schema)
+            ]
+            writer.write_table(pa.Table.from_arrays(arrays, schema=schema))
+
+def write_csv_from_parquet(parquet_path, csv_path):
+    """Export a Parquet file to CSV batch by batch"""
+    header = True
+    for batch in pq.ParquetFile(parquet_path).iter_batches():
+        batch.to_pandas().to_csv(csv_path, mode='w' if header else 'a', header=header, index=False)
+        header = False
 
 def generate_html_report(summary_stats, db_path):
     """Generate HTML report summarizing the database build"""
-    html = f"""<!DOCTYPE html>
+    age_rows = ''.join(
+        f"""            <tr>
+                <td>{age_group}</td>
+                <td>{summary_stats['age_distribution'][age_group]:,}</td>
+                <td>{summary_stats['age_percentages'][age_group]:.1f}%</td>
+            </tr>
+"""
+        for age_group in ['12-17', '18-25', '26-34', '35+']
+        if age_group in summary_stats['age_distribution']
+    )
+    year_rows = ''.join(
+        f"""            <tr>
+                <td>{year_stat['year']}</td>
+                <td>{year_stat['count']:,}</td>
+                <td>{year_stat['pct_under25']:.1f}%</td>
+                <td>{year_stat['avg_age_cat']:.2f}</td>
+            </tr>
+"""
+        for year_stat in summary_stats['year_stats']
+    )
+
+    return f"""<!DOCTYPE html>
 <html>
 <head>
     <meta charset="UTF-8">
@@ -287,19 +612,7 @@ def generate_html_report(summary_stats, db_path):
                 <th>Count</th>
                 <th>Percentage</th>
             </tr>
-"""
-    for age_group in ['12-17', '18-25', '26-34', '35+']:
-        if age_group in summary_stats['age_distribution']:
-            count = summary_stats['age_distribution'][age_group]
-            pct = summary_stats['age_percentages'][age_group]
-            html += f"""            <tr>
-                <td>{age_group}</td>
-                <td>{count:,}</td>
-                <td>{pct:.1f}%</td>
-            </tr>
-"""
-
-    html += """        </table>
+{age_rows}        </table>
 
         <h2>Records by Year</h2>
         <table>
@@ -309,17 +622,7 @@ def generate_html_report(summary_stats, db_path):
                 <th>% Under 25</th>
                 <th>Avg Age Category</th>
             </tr>
-"""
-    for year_stat in summary_stats['year_stats']:
-        html += f"""            <tr>
-                <td>{year_stat['year']}</td>
-                <td>{year_stat['count']:,}</td>
-                <td>{year_stat['pct_under25']:.1f}%</td>
-                <td>{year_stat['avg_age_cat']:.2f}</td>
-            </tr>
-"""
-
-    html += f"""        </table>
+{year_rows}        </table>
 
         <h2>Database Tables</h2>
         <table>
@@ -348,34 +651,89 @@ def generate_html_report(summary_stats, db_path):
 </body>
 </html>
 """
-    return html
 
-def main():
+def main(write_csv=False, verbose=False):
+    """Build the SQLite database (plus a Parquet copy) from all Stata files.
+
+    Args:
+        write_csv: Also write survey_data to nsduh_data.csv
+        verbose: Print each year's full processing log
+    """
     print("Building NSDUH SQLite Database")
     print("=" * 60)
 
     # Find all Stata zip files
-    data_dir = Path('data')
-    zip_files = sorted(glob.glob(str(data_dir / '*stata*.zip')))
+    stata_zips = find_stata_zips('data')
+    zip_files = [zip_path for zip_path, _ in stata_zips]
+    years = [year for _, year in stata_zips]
 
     print(f"\nFound {len(zip_files)} Stata files")
 
-    # Process each year
-    all_data = []
-    successful_years = []
-    failed_years = []
+    if len(zip_files) == 0:
+        print("\n❌ No data to save!")
+        return
 
-    for zip_path in zip_files:
-        # Extract year from filename
-        basename = os.path.basename(zip_path)
-        year = int(basename.split('-')[1])
+    db_path = 'data/processed/nsduh_data.db'
+    parquet_path = 'data/processed/nsduh_data.parquet'
+    os.makedirs(os.path.dirname(db_path), exist_ok=True)
 
-        df = process_year(zip_path, year)
-        if df is not None:
-            all_data.append(df)
+    # Process years in parallel and write each one out as it arrives (in year
+    # order), so the full table is never held in memory; only a few years are
+    # queued ahead of the writer. Each worker hands back its log for printing here.
+    successful_years = []
+    failed_years = []
+    table_columns = []
+    total_records = 0
+    age_dist = {}
+    year_stats = []
+    conn = None
+
+    workers = worker_count(zip_files)
+    print(f"\nProcessing years into SQLite database: {db_path}")
+    with tempfile.TemporaryDirectory(dir=os.path.dirname(db_path)) as pieces_dir, \
+            ProcessPoolExecutor(max_workers=workers) as executor:
+        piece_paths = []
+        for year, df, log in map_in_order(executor, process_year_logged, zip_files, years,
+                                          [verbose] * len(zip_files), window=workers):
+            print(log, end='')
+            if df is None:
+                failed_years.append(year)
+                continue
+            if not verbose:
+                print(f"  ✓ {year}: {len(df):,} records")
             successful_years.append(year)
-        else:
-            failed_years.append(year)
+
+            if conn is None:
+                conn = sqlite3.connect(db_path)
+                conn.executescript(BULK_LOAD_PRAGMAS)
+                create_table(conn, 'survey_data', df)
+                table_columns = list(df.columns)
+            else:
+                add_missing_columns(conn, 'survey_data', df, table_columns)
+            insert_rows(conn, 'survey_data', df)
+
+            piece_path = os.path.join(pieces_dir, f'{year}.parquet')
+            df.to_parquet(piece_path, index=False)
+            piece_paths.append(piece_path)
+
+            # Running statistics for the summary and report
+            count = len(df)
+            total_records += count
+            for group, group_count in df['age_group'].value_counts().items():
+                age_dist[group] = age_dist.get(group, 0) + group_count
+            # Categories 1 and 2 are under 25 (12-17 and 18-25)
+            year_stats.append({
+                'year': year,
+                'count': count,
+                'pct_under25': (df['age_category'] <= 2).sum() / count * 100,
+                'avg_age_cat': df['age_category'].mean()
+            })
+            del df
+
+        if piece_paths:
+            # Also save a columnar copy for quick inspection
+            print(f"Saving survey_data to Parquet: {parquet_path}")
+            combine_parquet_pieces(piece_paths, parquet_path)
 
     print(f"\n{'='*60}")
     print(f"SUMMARY")
@@ -386,57 +744,31 @@ def main():
     if failed_years:
         print(f"  Years: {failed_years}")
 
-    if len(all_data) == 0:
+    if conn is None:
         print("\n❌ No data to save!")
         return
 
-    # Combine all years
-    print(f"\nCombining data from all years...")
-    combined_df = pd.concat(all_data, ignore_index=True)
-
-    print(f"Total records: {len(combined_df):,}")
-    print(f"Total columns: {len(combined_df.columns)}")
+    print(f"Total records: {total_records:,}")
+    print(f"Total columns: {len(table_columns)}")
     print(f"\nAge category distribution across all years:")
-    age_dist = combined_df['age_group'].value_counts()
     age_percentages = {}
     for group in ['12-17', '18-25', '26-34', '35+']:
-        if group in age_dist.index:
+        if group in age_dist:
             count = age_dist[group]
-            pct = (count / len(combined_df)) * 100
+            pct = (count / total_records) * 100
             age_percentages[group] = pct
             print(f"  {group}: {count:,} ({pct:.1f}%)")
 
     # Show records by year
     print(f"\nRecords by year:")
-    year_counts = combined_df.groupby('year').size()
-    year_stats = []
-    for year, count in year_counts.items():
-        # Categories 1 and 2 are under 25 (12-17 and 18-25)
-        year_data = combined_df[combined_df['year'] == year]
-        pct_under25 = (year_data['age_category'] <= 2).sum() / count * 100
-        avg_age_cat = year_data['age_category'].mean()
-        year_stats.append({
-            'year': year,
-            'count': count,
-            'pct_under25': pct_under25,
-            'avg_age_cat': avg_age_cat
-        })
-        print(f"  {year}: {count:,} records ({pct_under25:.1f}% under 25, avg age cat: {avg_age_cat:.2f})")
-
-    # Save to SQLite
-    db_path = 'data/processed/nsduh_data.db'
-    print(f"\nSaving to SQLite database: {db_path}")
-
-    # Ensure directory exists
-    os.makedirs(os.path.dirname(db_path), exist_ok=True)
-
-    conn = sqlite3.connect(db_path)
-    combined_df.to_sql('survey_data', conn, if_exists='replace', index=False)
+    for year_stat in year_stats:
+        print(f"  {year_stat['year']}: {year_stat['count']:,} records "
+              f"({year_stat['pct_under25']:.1f}% under 25, avg age cat: {year_stat['avg_age_cat']:.2f})")
 
-    # Also save to CSV for quick inspection
-    csv_path = 'data/processed/nsduh_data.csv'
-    print(f"Saving survey_data to CSV: {csv_path}")
-    combined_df.to_csv(csv_path, index=False)
+    if write_csv:
+        csv_path = 'data/processed/nsduh_data.csv'
+        print(f"Saving survey_data to CSV: {csv_path}")
+        write_csv_from_parquet(parquet_path, csv_path)
 
     # Create indexes for faster queries
     print("Creating indexes for survey_data...")
@@ -444,13 +776,14 @@ def main():
     cursor.execute('CREATE INDEX IF NOT EXISTS idx_year ON survey_data(year)')
     cursor.execute('CREATE INDEX IF NOT EXISTS idx_age_category ON survey_data(age_category)')
     cursor.execute('CREATE INDEX IF NOT EXISTS idx_year_age ON survey_data(year, age_category)')
+    cursor.execute('CREATE INDEX IF NOT EXISTS idx_age_year ON survey_data(age_category, year)')
     conn.commit()
 
     # Load and add variable metadata table
     print("\nLoading variable metadata...")
-    metadata_path = 'metadata/variable_metadata.csv'
+    metadata_path = 'metadata/variable_metadata.parquet'
     if Path(metadata_path).exists():
-        df_metadata = pd.read_csv(metadata_path)
+        df_metadata = pd.read_parquet(metadata_path)
         print(f"  Found {len(df_metadata):,} metadata records")
 
         # Save to database
@@ -494,10 +827,10 @@ def main():
     print("\nGenerating HTML report...")
     summary_stats = {
         'total_years': len(successful_years),
-        'total_records': len(combined_df),
-        'total_columns': len(combined_df.columns),
+        'total_records': total_records,
+        'total_columns': len(table_columns),
         'db_size_mb': db_size_mb,
-        'age_distribution': age_dist.to_dict(),
+        'age_distribution': age_dist,
         'age_percentages': age_percentages,
         'year_stats': year_stats,
         'survey_data_records': row_count,
@@ -516,4 +849,10 @@ def main():
     print(f"{'='*60}")
 
 if __name__ == '__main__':
-    main()
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--csv', action='store_true',
+                        help='also write data/processed/nsduh_data.csv')
+    parser.add_argument('--verbose', action='store_true',
+                        help="print each year's full processing log")
+    args = parser.parse_args()
+    main(write_csv=args.csv, verbose=args.verbose)
@@ -2,13 +2,22 @@
 """
 Plot drug trends from the SQLite database
 """
+import numpy as np
 import pandas as pd
+import matplotlib
+# PNG output only: use the non-interactive backend (no GUI toolkit probing)
+matplotlib.use('Agg')
 import matplotlib.pyplot as plt
 import sqlite3
 from pathlib import Path
 from datetime import datetime
 import os
-import math
+
+plt.rcParams['figure.max_open_warning'] = 0
+plt.rcParams['agg.path.chunksize'] = 10000
+# Every axis gets the same light grid; set it once instead of per axis
+plt.rcParams['axes.grid'] = True
+plt.rcParams['grid.alpha'] = 0.3
 
 # Drug flags to plot with nice labels
 DRUG_FLAGS = {
@@ -39,9 +48,41 @@ DRUG_FLAGS = {
     'KRATOMFLAG': 'Kratom',
 }
 
+# Small tick labels for the (many) facet panels
+FACET_RC = {'xtick.labelsize': 8, 'ytick.labelsize': 8}
+
+# Fast zlib level for the (large) PNGs; the size cost is small for line plots
+PNG_SAVE_KWARGS = {'dpi': 200, 'pil_kwargs': {'compress_level': 1}}
+
+# Read-side settings for the aggregation queries: big page cache, memory-mapped
+# I/O, and no writes (the connection is also opened read-only)
+READ_PRAGMAS = """
+PRAGMA cache_size=-524288;
+PRAGMA temp_store=MEMORY;
+PRAGMA mmap_size=30000000000;
+PRAGMA query_only=ON;
+"""
+
 def generate_html_report(summary_stats, output_files):
     """Generate HTML report summarizing the analysis"""
-    html = f"""<!DOCTYPE html>
+    drug_rows = ''.join(
+        f"""            <tr>
+                <td><code>{drug_info['flag']}</code></td>
+                <td>{drug_info['label']}</td>
+                <td>{drug_info['year_count']}</td>
+            </tr>
+"""
+        for drug_info in summary_stats['drugs_with_data']
+    )
+    images = ''.join(
+        f"""        <h3>{os.path.basename(output_file)}</h3>
+        <img src="../{output_file}" alt="{os.path.basename(output_file)}">
+"""
+        for output_file in output_files
+        if output_file.endswith('.png')
+    )
+
+    return f"""<!DOCTYPE html>
 <html>
 <head>
     <meta charset="UTF-8">
@@ -88,26 +129,10 @@ def generate_html_report(summary_stats, output_files):
                 <th>Label</th>
                 <th>Years Available</th>
             </tr>
-"""
-    for drug_info in summary_stats['drugs_with_data']:
-        html += f"""            <tr>
-                <td><code>{drug_info['flag']}</code></td>
-                <td>{drug_info['label']}</td>
-                <td>{drug_info['year_count']}</td>
-            </tr>
-"""
-
-    html += """        </table>
+{drug_rows}        </table>
 
         <h2>Visualizations</h2>
-"""
-    for output_file in output_files:
-        if output_file.endswith('.png'):
-            html += f"""        <h3>{os.path.basename(output_file)}</h3>
-        <img src="../{output_file}" alt="{os.path.basename(output_file)}">
-"""
-
-    html += f"""
+{images}
         <div class="footer">
             <p>Data source: NSDUH SQLite database</p>
             <p>Age group: 18-25 years (age_category = 2)</p>
@@ -118,7 +143,37 @@ def generate_html_report(summary_stats, output_files):
 </body>
 </html>
 """
-    return html
+
+def first_year_labels(df_meta):
+    """Map each drug flag to its variable label from the first year it appears"""
+    first_by_var = (
+        df_meta.loc[df_meta['variable_name'].isin(list(DRUG_FLAGS)),
+                    ['year', 'variable_name', 'variable_label']]
+        .sort_values('year', kind='stable')
+        .drop_duplicates('variable_name', keep='first')
+        .set_index('variable_name')['variable_label']
+    )
+    return {flag: first_by_var[flag] for flag in DRUG_FLAGS if flag in first_by_var.index}
+
+def period_segments(years, values, period_ids, break_year=None):
+    """Yield (period_id, years, values) for each line segment of one series.
+
+    Missing values and years outside every period (2020) are dropped. Each
+    period is its own segment, split in two at break_year when the series
+    has a break.
+    """
+    keep = ~np.isnan(values) & (period_ids >= 0)
+    # Break side of each year, computed once rather than per period
+    after_break = years >= break_year if break_year else None
+    for period_id in np.unique(period_ids[keep]):
+        in_period = keep & (period_ids == period_id)
+        if after_break is not None:
+            parts = (in_period & ~after_break, in_period & after_break)
+        else:
+            parts = (in_period,)
+        for part in parts:
+            if part.any():
+                yield int(period_id), years[part], values[part]
 
 def nice_ylim(max_value, headroom=0.02):
     """Set y-axis max with small proportional headroom."""
@@ -135,7 +190,9 @@ def main():
         return
 
     print(f"Loading data from {db_path}...")
-    conn = sqlite3.connect(db_path)
+    # Read-only: the (age_category, year) index comes from build_database.py
+    conn = sqlite3.connect(f"file:{db_path}?mode=ro", uri=True)
+    conn.executescript(READ_PRAGMAS)
 
     # Try to load metadata from database, fallback to CSV if not available
     flag_descriptions = {}
@@ -145,24 +202,13 @@ def main():
         if cursor.fetchone():
             print("Loading metadata from database...")
             df_meta = pd.read_sql_query("SELECT * FROM variable_metadata", conn)
-
-            # Get first appearance description for each flag
-            for flag in DRUG_FLAGS.keys():
-                flag_data = df_meta[df_meta['variable_name'] == flag]
-                if len(flag_data) > 0:
-                    # Get the first year's description
-                    first_row = flag_data.sort_values('year').iloc[0]
-                    flag_descriptions[flag] = first_row['variable_label']
+            flag_descriptions = first_year_labels(df_meta)
         else:
-            print("⚠️  No metadata table in database, trying CSV...")
-            metadata_path = 'metadata/variable_metadata.csv'
+            print("⚠️  No metadata table in database, trying metadata file...")
+            metadata_path = 'metadata/variable_metadata.parquet'
             if Path(metadata_path).exists():
-                df_meta = pd.read_csv(metadata_path)
-                for flag in DRUG_FLAGS.keys():
-                    flag_data = df_meta[df_meta['variable_name'] == flag]
-                    if len(flag_data) > 0:
-                        first_row = flag_data.sort_values('year').iloc[0]
-                        flag_descriptions[flag] = first_row['variable_label']
+                df_meta = pd.read_parquet(metadata_path)
+                flag_descriptions = first_year_labels(df_meta)
     except Exception as e:
         print(f"⚠️  Could not load metadata: {e}")
         print("Continuing without metadata descriptions...")
@@ -170,7 +216,7 @@ def main():
     # Get all columns
     cursor = conn.cursor()
     cursor.execute("PRAGMA table_info(survey_data)")
-    all_columns = [col[1] for col in cursor.fetchall()]
+    all_columns = {col[1] for col in cursor.fetchall()}
 
     # Find which drug flags are in the database
     available_flags = [flag for flag in DRUG_FLAGS.keys() if flag in all_columns]
@@ -193,65 +239,85 @@ def main():
         'pain_relievers': ['PNRANYFLAG', 'ANLFLAG'],
         'ketamine': ['KETAFLGR', 'KETMINFLAG'],
     }
+    # First year each source variable was used, for every derived flag, in one
+    # query: one small GROUP BY per *_source column, UNION ALL'd together
+    source_queries = [
+        f"SELECT '{derived_flag}' AS derived_flag, {derived_flag}_source AS source, "
+        f"MIN(year) AS first_year FROM survey_data "
+        f"WHERE {derived_flag}_source IS NOT NULL GROUP BY {derived_flag}_source"
+        for derived_flag in derived_sources
+        if f"{derived_flag}_source" in all_columns
+    ]
     break_years = {}
-    for derived_flag, sources in derived_sources.items():
-        source_col = f"{derived_flag}_source"
-        if source_col not in all_columns:
-            continue
-        source_df = pd.read_sql_query(
-            f"SELECT year, {source_col} FROM survey_data WHERE {source_col} IS NOT NULL",
-            conn
-        )
-        primary_source = sources[0]
-        primary_years = source_df[source_df[source_col] == primary_source]['year']
-        if len(primary_years) == 0:
-            continue
-        first_primary_year = int(primary_years.min())
-        earlier_sources = source_df[source_df['year'] < first_primary_year][source_col].unique()
-        if len(earlier_sources) > 0:
-            break_years[derived_flag] = first_primary_year
-
-    # Query data for people aged 18-25 (age_category 2=18-25)
+    if source_queries:
+        first_years = pd.read_sql_query(' UNION ALL '.join(source_queries), conn)
+        for derived_flag, group in first_years.groupby('derived_flag'):
+            source_first_years = dict(zip(group['source'], group['first_year']))
+            primary_source = derived_sources[derived_flag][0]
+            if primary_source not in source_first_years:
+                continue
+            first_primary_year = int(source_first_years[primary_source])
+            if group['first_year'].min() < first_primary_year:
+                break_years[derived_flag] = first_primary_year
+
+    # Aggregate in SQLite for people aged 18-25 (age_category 2=18-25), so only
+    # one row per year crosses into pandas.
+    # Weights account for survey design and make estimates comparable across time
+    # Numerator: weight of respondents with flag == 1; denominator: weight of
+    # respondents with a non-missing flag.
+    sums = ',\n        '.join(
+        f'TOTAL(CASE WHEN "{flag}" = 1 THEN analysis_weight END) AS "used_{flag}", '
+        f'TOTAL(CASE WHEN "{flag}" IS NOT NULL THEN analysis_weight END) AS "total_{flag}"'
+        for flag in available_flags
+    )
     query = f"""
-    SELECT year, age_category, age_group, analysis_weight, {', '.join(available_flags)}
+    SELECT year, COUNT(*) AS n_records,
+        {sums}
     FROM survey_data
     WHERE age_category = 2
+    GROUP BY year
+    ORDER BY year
     """
-
-    df = pd.read_sql_query(query, conn)
+    df_sums = pd.read_sql_query(query, conn)
+
+    total_records = int(df_sums['n_records'].sum())
+    print(f"Loaded {total_records:,} records for people aged 18-25")
+    # Age group breakdown is a diagnostic only; it costs an extra scan
+    if os.environ.get('NSDUH_VERBOSE'):
+        age_groups = pd.read_sql_query(
+            "SELECT age_group, COUNT(*) AS n FROM survey_data WHERE age_category = 2 GROUP BY age_group",
+            conn
+        )
+        print(f"Age groups: {dict(zip(age_groups['age_group'], age_groups['n']))}")
     conn.close()
 
-    print(f"Loaded {len(df):,} records for people aged 18-25")
-    print(f"Age groups: {df['age_group'].value_counts().to_dict()}")
-
-    # Calculate WEIGHTED percentages by year for each drug
-    # Weights account for survey design and make estimates comparable across time
-    results = []
-
-    for year in sorted(df['year'].unique()):
-        df_year = df[df['year'] == year]
-        row = {'year': year}
+    weighted_used = df_sums[[f'used_{flag}' for flag in available_flags]].to_numpy()
+    weighted_total = df_sums[[f'total_{flag}' for flag in available_flags]].to_numpy()
+    # Years where a flag was never asked give 0/0; those are masked to NaN below
+    with np.errstate(divide='ignore', invalid='ignore'):
+        pct = weighted_used / weighted_total * 100
+    df_trends = pd.DataFrame(pct, columns=available_flags).where(weighted_total > 0)
+    df_trends.insert(0, 'year', df_sums['year'])
 
-        for flag in available_flags:
-            # Use weighted calculations
-            df_valid = df_year[df_year[flag].notna()]
-            if len(df_valid) > 0:
-                # Weighted count of ever used (flag == 1)
-                weighted_ever_used = df_valid[df_valid[flag] == 1]['analysis_weight'].sum()
-                # Weighted total
-                weighted_total = df_valid['analysis_weight'].sum()
-
-                if weighted_total > 0:
-                    pct = (weighted_ever_used / weighted_total) * 100
-                    row[flag] = pct
-                else:
-                    row[flag] = None
-            else:
-                row[flag] = None
-
-        results.append(row)
+    # Define methodology periods with different colors (exclude 2020)
+    # Note: 2002-2019 are comparable per SAMHSA PUF harmonization
+    periods = [
+        (1979, 1998, '#1f77b4', '1979-1998'),
+        (1999, 2001, '#ff7f0e', '1999-2001'),
+        (2002, 2019, '#2ca02c', '2002-2019'),  # Comparable period
+        # Skip 2020
+        (2021, 2024, '#9467bd', '2021+')
+    ]
+    # Index into periods for each year (-1 for 2020 and years outside all periods)
+    period_bins = pd.IntervalIndex.from_tuples(
+        [(start_year, end_year) for start_year, end_year, _, _ in periods], closed='both'
+    )
+    df_trends['period_id'] = pd.cut(df_trends['year'], period_bins).cat.codes
 
-    df_trends = pd.DataFrame(results)
+    # df_trends is tiny (years x flags): plot from plain arrays (rows are in year order)
+    years = df_trends['year'].to_numpy()
+    period_ids = df_trends['period_id'].to_numpy()
+    series = {flag: df_trends[flag].to_numpy(dtype=float) for flag in available_flags}
 
     # Ensure output directories exist
     os.makedirs('plots', exist_ok=True)
@@ -294,25 +360,18 @@ def main():
     illicit_flags = [flag for flag in illicit_candidates if flag in available_flags]
 
     # Count how many illicit drugs have data
-    drugs_with_data = []
-    for flag in illicit_flags:
-        if flag in df_trends.columns:
-            data = df_trends[['year', flag]].dropna()
-            if len(data) > 0:
-                label = DRUG_FLAGS.get(flag, flag)
-                drugs_with_data.append((flag, label, len(data)))
+    year_counts = {flag: int((~np.isnan(series[flag])).sum()) for flag in illicit_flags}
+    drugs_with_data = [
+        (flag, DRUG_FLAGS.get(flag, flag), year_counts[flag])
+        for flag in illicit_flags
+        if year_counts[flag] > 0
+    ]
 
     # Order facets by most recent available percent (descending)
-    latest_year = df_trends['year'].max()
-    latest_values = {}
-    for flag, _, _ in drugs_with_data:
-        series = df_trends[['year', flag]].dropna()
-        if len(series) == 0:
-            continue
-        most_recent = series[series['year'] == latest_year]
-        if most_recent.empty:
-            most_recent = series.sort_values('year').tail(1)
-        latest_values[flag] = float(most_recent[flag].iloc[0])
+    latest_values = {
+        flag: float(series[flag][~np.isnan(series[flag])][-1])
+        for flag, _, _ in drugs_with_data
+    }
 
     drugs_with_data.sort(
         key=lambda item: latest_values.get(item[0], -1.0),
@@ -326,53 +385,29 @@ def main():
     n_cols = 2
     n_rows = (n_drugs + n_cols - 1) // n_cols
 
-    # Increase height to accommodate captions
-    fig, axes = plt.subplots(n_rows, n_cols, figsize=(16, n_rows * 7.0), sharey=True)
-    if n_drugs == 1:
-        axes = [axes]
-    else:
-        axes = axes.flatten()
-
-    # Define methodology periods with different colors (exclude 2020)
-    # Note: 2002-2019 are comparable per SAMHSA PUF harmonization
-    periods = [
-        (1979, 1998, '#1f77b4', '1979-1998'),
-        (1999, 2001, '#ff7f0e', '1999-2001'),
-        (2002, 2019, '#2ca02c', '2002-2019'),  # Comparable period
-        # Skip 2020
-        (2021, 2024, '#9467bd', '2021+')
-    ]
+    # Increase height to accommodate captions. Axes share x and y, so the
+    # limits are set once on the first panel and propagate to the rest.
+    with plt.rc_context(FACET_RC):
+        fig, axes = plt.subplots(n_rows, n_cols, figsize=(16, n_rows * 7.0),
+                                 sharex=True, sharey=True, constrained_layout=True,
+                                 squeeze=False)
+    axes = axes.flatten()
 
     # Use a shared y-limit across illicit drugs for comparability
-    illicit_max = 0
-    for flag, _, _ in drugs_with_data:
-        series_max = df_trends[flag].max(skipna=True)
-        if pd.notna(series_max):
-            illicit_max = max(illicit_max, float(series_max))
-    illicit_ylim = nice_ylim(illicit_max)
+    illicit_max = df_trends[[flag for flag, _, _ in drugs_with_data]].max(skipna=True).max()
+    illicit_ylim = nice_ylim(float(illicit_max) if pd.notna(illicit_max) else 0)
+    axes[0].set_xlim(df_trends['year'].min() - 1, df_trends['year'].max() + 1)
+    axes[0].set_ylim(0, illicit_ylim)
 
     for idx, (flag, label, _) in enumerate(drugs_with_data):
         ax = axes[idx]
-        data = df_trends[['year', flag]].dropna()
-
-        # Exclude 2020 data
-        data = data[data['year'] != 2020]
-
-        # Plot each methodology period separately with different colors (no connecting lines across breaks)
-        for start_year, end_year, color, period_label in periods:
-            period_data = data[(data['year'] >= start_year) & (data['year'] <= end_year)]
-            if len(period_data) > 0:
-                break_year = break_years.get(flag)
-                if break_year:
-                    left = period_data[period_data['year'] < break_year]
-                    right = period_data[period_data['year'] >= break_year]
-                    for segment in (left, right):
-                        if len(segment) > 0:
-                            ax.plot(segment['year'], segment[flag], marker='o', color=color,
-                                   linewidth=2, markersize=4, label=period_label if idx == 0 else '')
-                else:
-                    ax.plot(period_data['year'], period_data[flag], marker='o', color=color,
-                           linewidth=2, markersize=4, label=period_label if idx == 0 else '')
+        # Plot each methodology period separately with different colors (no connecting
+        # lines across breaks); 2020 is excluded
+        for period_id, xs, ys in period_segments(years, series[flag], period_ids,
+                                                 break_years.get(flag)):
+            _, _, color, period_label = periods[period_id]
+            ax.plot(xs, ys, marker='o', color=color,
+                    linewidth=2, markersize=4, label=period_label if idx == 0 else '')
 
         # Add vertical lines for series breaks only (not within 2002-2019)
         ax.axvline(x=1998.5, color='gray', linestyle='--', alpha=0.3, linewidth=1)
@@ -404,29 +439,28 @@ def main():
                 clip_on=False,
             )
 
-        ax.set_xlabel('Year', fontsize=8)
+        # Only the bottom panel of each column shows year ticks, so label just those
+        if idx + n_cols >= n_drugs:
+            ax.set_xlabel('Year', fontsize=8)
         ax.set_ylabel('Lifetime Use (%)', fontsize=8)
-        ax.grid(True, alpha=0.3)
-        ax.set_xlim(df_trends['year'].min() - 1, df_trends['year'].max() + 1)
-        ax.set_ylim(0, illicit_ylim)
-        ax.tick_params(labelsize=8)
 
-    # Hide unused subplots
+    # Hide unused subplots; the panel above a hidden one is now the bottom of
+    # its column, so give it back the year ticks that sharex removed
     for idx in range(len(drugs_with_data), len(axes)):
         axes[idx].axis('off')
+        axes[idx - n_cols].xaxis.set_tick_params(labelbottom=True)
 
     plt.suptitle(
         'Drug use by 18-25 year-olds, United States',
         fontsize=14,
         fontweight='bold',
-        y=1.0,
     )
-    plt.tight_layout(rect=[0, 0, 1, 0.98])
-    plt.savefig('plots/drug_trends_illicit_facets.png', dpi=200, bbox_inches='tight')
+    plt.savefig('plots/drug_trends_illicit_facets.png', **PNG_SAVE_KWARGS)
+    plt.close(fig)
     print("Saved plot to plots/drug_trends_illicit_facets.png")
 
     # Core plot: alcohol, any illicit, tobacco
-    fig, ax = plt.subplots(figsize=(12, 6))
+    fig, ax = plt.subplots(figsize=(12, 6), constrained_layout=True)
     core_colors = {
         'ALCFLAG': '#1f77b4',
         'any_illicit': '#ff7f0e',
@@ -434,53 +468,27 @@ def main():
     }
     plotted_labels = set()
     for flag in core_flags:
-        data = df_trends[['year', flag]].dropna()
-        data = data[data['year'] != 2020]
-        for start_year, end_year, _, _ in periods:
-            period_data = data[(data['year'] >= start_year) & (data['year'] <= end_year)]
-            if len(period_data) > 0:
-                break_year = break_years.get(flag)
-                label = DRUG_FLAGS.get(flag, flag)
-                label_to_use = label if label not in plotted_labels else None
-                if break_year:
-                    left = period_data[period_data['year'] < break_year]
-                    right = period_data[period_data['year'] >= break_year]
-                    for segment in (left, right):
-                        if len(segment) > 0:
-                            ax.plot(
-                                segment['year'],
-                                segment[flag],
-                                marker='o',
-                                color=core_colors.get(flag, '#333333'),
-                                linewidth=2,
-                                markersize=4,
-                                label=label_to_use,
-                            )
-                            plotted_labels.add(label)
-                            label_to_use = None
-                else:
-                    ax.plot(
-                        period_data['year'],
-                        period_data[flag],
-                        marker='o',
-                        color=core_colors.get(flag, '#333333'),
-                        linewidth=2,
-                        markersize=4,
-                        label=label_to_use,
-                    )
-                    plotted_labels.add(label)
+        label = DRUG_FLAGS.get(flag, flag)
+        for _, xs, ys in period_segments(years, series[flag], period_ids,
+                                         break_years.get(flag)):
+            ax.plot(
+                xs,
+                ys,
+                marker='o',
+                color=core_colors.get(flag, '#333333'),
+                linewidth=2,
+                markersize=4,
+                label=label if label not in plotted_labels else None,
+            )
+            plotted_labels.add(label)
 
     ax.axvline(x=1998.5, color='gray', linestyle='--', alpha=0.4, linewidth=1.0)
     ax.axvline(x=2001.5, color='gray', linestyle='--', alpha=0.4, linewidth=1.0)
     ax.axvline(x=2019.5, color='gray', linestyle='--', alpha=0.4, linewidth=1.0)
     ax.axvspan(2019.5, 2020.5, alpha=0.2, color='gray')
 
-    core_max = 0
-    for flag in core_flags:
-        series_max = df_trends[flag].max(skipna=True)
-        if pd.notna(series_max):
-            core_max = max(core_max, float(series_max))
-    core_ylim = nice_ylim(core_max)
+    core_max = df_trends[core_flags].max(skipna=True).max()
+    core_ylim = nice_ylim(float(core_max) if pd.notna(core_max) else 0)
 
     ax.set_xlabel('Year', fontsize=11)
     ax.set_ylabel('Lifetime Use (%)', fontsize=11)
@@ -489,20 +497,19 @@ def main():
         fontsize=13,
         fontweight='bold',
     )
-    ax.grid(True, alpha=0.3)
     ax.set_xlim(df_trends['year'].min() - 1, df_trends['year'].max() + 1)
     ax.set_ylim(0, core_ylim)
     ax.legend(loc='upper left', fontsize=9)
 
-    plt.tight_layout()
-    plt.savefig('plots/drug_trends_core.png', dpi=200, bbox_inches='tight')
+    plt.savefig('plots/drug_trends_core.png', **PNG_SAVE_KWARGS)
+    plt.close(fig)
     print("Saved plot to plots/drug_trends_core.png")
 
     # Generate HTML report
     print("\nGenerating HTML report...")
     summary_stats = {
-        'total_years': len(df['year'].unique()),
-        'total_records': len(df),
+        'total_years': len(df_trends),
+        'total_records': total_records,
         'drug_flags_count': len(drugs_with_data),
         'drugs_with_data': [
             {'flag': flag, 'label': label, 'year_count': year_count}
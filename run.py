@@ -3,33 +3,46 @@
 Master pipeline script to run complete NSDUH analysis
 Runs all steps in correct order with proper error handling
 """
+import os
 import sys
 import subprocess
+from concurrent.futures import ThreadPoolExecutor
 from pathlib import Path
 
 def run_step(script_name, description):
     """Run a Python script and handle errors"""
-    print(f"\n{'='*70}")
-    print(f"STEP: {description}")
-    print(f"Running: {script_name}")
-    print(f"{'='*70}\n")
+    # One write per header, so headers of parallel steps don't interleave
+    print(f"\n{'='*70}\nSTEP: {description}\nRunning: {script_name}\n{'='*70}\n")
 
     script_path = Path('py') / script_name
     if not script_path.exists():
         print(f"❌ ERROR: Script not found: {script_path}")
         return False
 
-    try:
-        result = subprocess.run(
-            [sys.executable, str(script_path)],
-            check=True,
-            capture_output=False  # Show output in real-time
-        )
-        print(f"\n✅ {description} completed successfully")
-        return True
-    except subprocess.CalledProcessError as e:
-        print(f"\n❌ ERROR: {description} failed with exit code {e.returncode}")
+    # Forward the step's output line by line, tagged with the script name so
+    # steps running in parallel stay readable. The child is unbuffered so
+    # lines arrive as they are printed.
+    env = dict(os.environ, PYTHONUNBUFFERED='1', PYTHONIOENCODING='utf-8')
+    prefix = f"[{script_path.stem}] "
+    process = subprocess.Popen(
+        [sys.executable, str(script_path)],
+        stdout=subprocess.PIPE,
+        stderr=subprocess.STDOUT,
+        bufsize=1,
+        text=True,
+        encoding='utf-8',
+        errors='replace',
+        env=env,
+    )
+    for line in process.stdout:
+        sys.stdout.write(prefix + line)
+    returncode = process.wait()
+
+    if returncode != 0:
+        print(f"\n❌ ERROR: {description} failed with exit code {returncode}")
         return False
+    print(f"\n✅ {description} completed successfully")
+    return True
 
 def main():
     print("""
@@ -39,20 +52,33 @@ def main():
 ╚══════════════════════════════════════════════════════════════════════╝
     """)
 
-    steps = [
-        ('01_download/download_nsduh_data.py', 'Download Stata data and setup files'),
-        ('01_download/download_concordance_files.py', 'Download concordance (crosswalk) files'),
-        ('02_build_metadata/build_metadata.py', 'Build comprehensive metadata'),
-        ('03_build_database/build_database.py', 'Build SQLite database (15-30 minutes)'),
-        ('04_analysis/plot_trends.py', 'Generate trend visualizations'),
+    # Stages run in order; steps within a stage are independent and run concurrently
+    stages = [
+        [
+            ('01_download/download_nsduh_data.py', 'Download Stata data and setup files'),
+            ('01_download/download_concordance_files.py', 'Download concordance (crosswalk) files'),
+        ],
+        [('02_build_metadata/build_metadata.py', 'Build comprehensive metadata')],
+        [('03_build_database/build_database.py', 'Build SQLite database (15-30 minutes)')],
+        [('04_analysis/plot_trends.py', 'Generate trend visualizations')],
     ]
+    total_steps = sum(len(stage) for stage in stages)
+
+    step_number = 0
+    for stage in stages:
+        first_step = step_number + 1
+        step_number += len(stage)
+        if len(stage) == 1:
+            print(f"\n[Step {first_step}/{total_steps}]")
+        else:
+            print(f"\n[Steps {first_step}-{step_number}/{total_steps}, in parallel]")
 
-    for i, (script, description) in enumerate(steps, 1):
-        print(f"\n[Step {i}/{len(steps)}]")
-        success = run_step(script, description)
+        with ThreadPoolExecutor(max_workers=len(stage)) as executor:
+            results = list(executor.map(lambda step: run_step(*step), stage))
 
-        if not success:
-            print(f"\n❌ Pipeline failed at step {i}: {description}")
+        failed = [description for (_, description), success in zip(stage, results) if not success]
+        if failed:
+            print(f"\n❌ Pipeline failed at: {', '.join(failed)}")
             print("Fix the error and run again, or run individual scripts manually.")
             sys.exit(1)
 
@@ -61,7 +87,7 @@ def main():
     print(f"{'='*70}\n")
     print("Output files created:")
     print("  • data/processed/nsduh_data.db - SQLite database (survey_data + variable_metadata)")
-    print("  • metadata/variable_metadata.csv - Comprehensive variable metadata")
+    print("  • metadata/variable_metadata.parquet - Comprehensive variable metadata")
     print("  • plots/drug_trends_18_25_*.png - Visualizations")
     print("  • reports/*.html - HTML summary reports for each step")
     print("\nSee README.md for details on outputs and methodology.")
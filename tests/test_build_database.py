@@ -0,0 +1,64 @@
+"""
+Tests for py/03_build_database/build_database.py
+"""
+import importlib.util
+import os
+import tempfile
+import unittest
+from pathlib import Path
+
+import pandas as pd
+
+MODULE_PATH = Path(__file__).parent.parent / 'py' / '03_build_database' / 'build_database.py'
+spec = importlib.util.spec_from_file_location('build_database', MODULE_PATH)
+build_database = importlib.util.module_from_spec(spec)
+spec.loader.exec_module(build_database)
+
+
+class DowncastFlagTest(unittest.TestCase):
+    def test_flag_dtypes(self):
+        self.assertEqual(build_database.downcast_flag(pd.Series([1.0, 0.0, None])).dtype, 'Int8')
+        self.assertEqual(build_database.downcast_flag(pd.Series([None, None])).dtype, 'Int8')
+        # Missing-data codes and fractions fall back to float64 whatever the input type
+        self.assertEqual(build_database.downcast_flag(pd.Series([985, 1], dtype='int16')).dtype, 'float64')
+        self.assertEqual(build_database.downcast_flag(pd.Series([0.5])).dtype, 'float64')
+
+
+class CombineParquetPiecesTest(unittest.TestCase):
+    def test_mixed_dtype_years(self):
+        # ecstasy fits Int8 in one year but carries missing-data codes in the
+        # next; KETMINFLAG only exists in the second year
+        year_a = pd.DataFrame({
+            'year': [2002, 2002, 2002],
+            'ecstasy': pd.array([0, 1, pd.NA], dtype='Int8'),
+            'ecstasy_source': ['ECSFLAG'] * 3,
+        })
+        year_b = pd.DataFrame({
+            'year': [2003, 2003],
+            'ecstasy': [985.0, 1.0],
+            'ecstasy_source': ['ECSTASY'] * 2,
+            'KETMINFLAG': pd.array([1, 0], dtype='Int8'),
+        })
+
+        with tempfile.TemporaryDirectory() as tmpdir:
+            piece_paths = []
+            for name, df in [('a', year_a), ('b', year_b)]:
+                piece_path = os.path.join(tmpdir, f'{name}.parquet')
+                df.to_parquet(piece_path, index=False)
+                piece_paths.append(piece_path)
+            output_path = os.path.join(tmpdir, 'combined.parquet')
+            build_database.combine_parquet_pieces(piece_paths, output_path)
+            combined = pd.read_parquet(output_path)
+
+        expected = pd.concat([year_a, year_b], ignore_index=True)
+        self.assertEqual(list(combined.columns), list(expected.columns))
+        self.assertEqual(combined['ecstasy'].dtype, 'float64')
+        self.assertEqual(combined['KETMINFLAG'].dtype, 'Int8')
+        self.assertEqual(combined['ecstasy'].tolist()[:2], [0.0, 1.0])
+        self.assertTrue(pd.isna(combined['ecstasy'][2]))
+        self.assertEqual(combined['ecstasy'].tolist()[3:], [985.0, 1.0])
+        self.assertEqual(combined['KETMINFLAG'].isna().tolist(), [True] * 3 + [False] * 2)
+
+
+if __name__ == '__main__':
+    unittest.main()
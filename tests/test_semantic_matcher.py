@@ -0,0 +1,134 @@
+"""
+Tests for py/02_build_metadata/helpers/semantic_matcher.py
+"""
+import contextlib
+import importlib.util
+import io
+import unittest
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+MODULE_PATH = Path(__file__).parent.parent / 'py' / '02_build_metadata' / 'helpers' / 'semantic_matcher.py'
+spec = importlib.util.spec_from_file_location('semantic_matcher', MODULE_PATH)
+semantic_matcher = importlib.util.module_from_spec(spec)
+spec.loader.exec_module(semantic_matcher)
+
+
+def features_for(labels, names=None):
+    """Run extract_semantic_features on labels (variable names default to X)"""
+    df = pd.DataFrame({
+        'variable_name': names or ['X'] * len(labels),
+        'variable_label': labels,
+    })
+    return semantic_matcher.extract_semantic_features(df)
+
+
+def bridges_for(rows, columns):
+    """Run compute_semantic_bridges quietly on a list of row tuples"""
+    with contextlib.redirect_stdout(io.StringIO()):
+        return semantic_matcher.compute_semantic_bridges(pd.DataFrame(rows, columns=columns))
+
+
+class ExtractSemanticFeaturesTest(unittest.TestCase):
+    def test_past_period_joining(self):
+        features = features_for([
+            'ALCOHOL USE PAST 30 DAYS',
+            'ALCOHOL USE PAST  MONTH',
+            'ALCOHOL USE PAST12',
+            'ALCOHOL USE IN PAST 12 MONTHS',
+            'ALCOHOL USE PAST YR',
+            'PASTA EATEN IN LAST 30 DAYS',
+        ])
+        self.assertEqual(features['time_period'].tolist(), [
+            'past_30_days', 'past_30_days', 'past_year', 'past_year', 'past_year', '',
+        ])
+
+    def test_label_prefixes(self):
+        features = features_for([
+            'RC-MARIJUANA - EVER USED',
+            'RC- ADULT: COCAINE - EVER USED',
+            'YOUTH: HEROIN EVER USED',
+            '  adult: alcohol  ',
+        ])
+        self.assertEqual(features['clean_label'].tolist(), ['MARIJUANA', 'COCAINE', 'HEROIN', 'ALCOHOL'])
+
+    def test_first_match_priority(self):
+        # Keyword priority decides, not position in the label
+        features = features_for([
+            'COCAINE OR MARIJUANA',
+            'PAST 30 DAYS OR EVER',
+            'AGE AT FIRST USE FLAG',
+            'NOTHING RELEVANT',
+        ])
+        self.assertEqual(features['substance'].tolist(), ['marijuana', 'other', 'other', 'other'])
+        self.assertEqual(features['time_period'].tolist(), ['', 'lifetime', '', ''])
+        self.assertEqual(features['measure_type'].tolist(), ['use', 'use', 'use_indicator', 'use'])
+
+    def test_whole_word_keywords_include_variable_name(self):
+        features = features_for(['', 'SOMETHING'], names=['MJ', 'MRJFLAG'])
+        # MJ is a keyword token; MRJFLAG is not split into MRJ + FLAG
+        self.assertEqual(features['substance'].tolist(), ['marijuana', 'other'])
+        self.assertEqual(features['measure_type'].tolist(), ['use', 'use'])
+
+    def test_nan_labels(self):
+        features = features_for([np.nan, 'MARIJUANA - EVER USED'], names=['MJ', 'MRJFLAG'])
+        self.assertEqual(features['clean_label'].tolist(), ['', 'MARIJUANA'])
+        self.assertEqual(features['substance'].tolist(), ['marijuana', 'marijuana'])
+        self.assertEqual(features['time_period'].tolist(), ['', 'lifetime'])
+
+
+class ComputeSemanticBridgesTest(unittest.TestCase):
+    COLUMNS = ['year', 'variable_name', 'variable_label', 'confirmed_group', 'cross_year_confirmed']
+
+    def test_narrow_bridges_by_name_and_features(self):
+        result = bridges_for([
+            (2003, 'MRJFLAG', 'RC-MARIJUANA - EVER USED', '', ''),
+            (2002, 'MRJFLAG', 'MARIJUANA - EVER USED', '', ''),
+            (2002, 'COCFLAG', 'COCAINE - EVER USED', '', ''),
+            (2004, 'MRJFLAG', 'MARIJUANA PAST 30 DAYS', '', ''),
+        ], self.COLUMNS)
+        self.assertEqual(result['cross_year_narrow'].tolist(), [
+            'MRJFLAG_narrow_2002', 'MRJFLAG_narrow_2002', 'COCFLAG_narrow_2002', 'MRJFLAG_narrow_2004',
+        ])
+
+    def test_confirmed_group_expansion(self):
+        result = bridges_for([
+            (2002, 'ALCFLAG', 'ALCOHOL - EVER USED', 'g', 'G2'),
+            # Same narrow key as the 2002 row: the key goes to the lowest id, G1
+            (2003, 'ALCFLAG', 'ALCOHOL - EVER USED', 'g', 'G1'),
+            # Different narrow key, pulled in through G1
+            (2004, 'ALCEVER', 'EVER USED ALCOHOL', 'g', 'G1'),
+            # Unconfirmed, but shares the 2004 row's narrow key
+            (2006, 'ALCEVER', 'EVER USED ALCOHOL', '', ''),
+            # Only ever seen with G2, which no longer holds the ALCFLAG key
+            (2005, 'ALCEVER2', 'ALCOHOL', 'g', 'G2'),
+        ], self.COLUMNS)
+        self.assertEqual(result['cross_year_narrow'].tolist(), [
+            'ALCFLAG_narrow_2002', 'ALCFLAG_narrow_2002', 'ALCFLAG_narrow_2002',
+            'ALCFLAG_narrow_2002', 'ALCEVER2_narrow_2005',
+        ])
+
+    def test_without_confirmed_column(self):
+        result = bridges_for([
+            (2002, 'MRJFLAG', 'MARIJUANA - EVER USED', ''),
+            (2003, 'MRJFLAG', 'MARIJUANA - EVER USED', ''),
+        ], self.COLUMNS[:-1])
+        self.assertEqual(result['cross_year_narrow'].tolist(), ['MRJFLAG_narrow_2002'] * 2)
+
+    def test_nan_labels(self):
+        # A missing label bridges with an empty one (both clean to '')
+        result = bridges_for([
+            (2002, 'MJ', np.nan, '', ''),
+            (2003, 'MJ', '', '', ''),
+            (2004, 'MJ', 'MARIJUANA', '', ''),
+        ], self.COLUMNS)
+        self.assertEqual(result['clean_label'].tolist(), ['', '', 'MARIJUANA'])
+        self.assertEqual(result['cross_year_narrow'].tolist(), [
+            'MJ_narrow_2002', 'MJ_narrow_2002', 'MJ_narrow_2004',
+        ])
+
+
+if __name__ == '__main__':
+    unittest.main()